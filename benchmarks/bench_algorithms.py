@@ -0,0 +1,66 @@
+"""Signing throughput of each signature algorithm, by body size
+
+For every algorithm this interpreter supports, times keyed_digest over a canonical URL and
+a body, and is_api_key_valid on a POST of that size, which also reads the body in chunks.
+
+    python benchmarks/bench_algorithms.py --sizes 1KB,64KB,1MB,16MB
+"""
+from __future__ import division, print_function
+import argparse
+
+from common import measure, parse_size, setup_django
+
+setup_django()
+
+from django.conf import settings
+from django.test import RequestFactory
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.client import Signer
+from tastypie_hmacauth.signing import available_algorithms, keyed_digest
+
+URL = b'http://localhost/api/v1/funcionario/?public_key=1&timestamp=1439806210'
+# bytes hashed per timing run, so small bodies are repeated enough to be measurable
+BUDGET = 64 * 1024 ** 2
+
+
+def digest_throughput(algorithm, body):
+    def sign():
+        digest_maker = keyed_digest(settings.SECRET_KEY, algorithm)
+        digest_maker.update(URL)
+        digest_maker.update(body)
+        return digest_maker.hexdigest()
+    return measure(sign, number=max(1, BUDGET // len(body)), repeat=3)
+
+
+def verify_throughput(algorithm, body):
+    signer = Signer('1', settings.SECRET_KEY, algorithm=algorithm)
+    url, _ = signer.sign('POST', 'http://localhost/api/v1/funcionario/', body, timestamp='1439806210')
+    path = url[len('http://localhost'):]
+    auth = HMACAuthentication()
+    api_key = path.rsplit('api_key=', 1)[1]
+    factory = RequestFactory()
+
+    def verify():
+        request = factory.post(path, data=body, content_type='application/json')
+        return auth.is_api_key_valid(api_key, request, '1')
+    assert verify()
+    return measure(verify, number=max(1, BUDGET // len(body) // 4), repeat=3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1KB,64KB,1MB,16MB',
+                        type=lambda sizes: [parse_size(size) for size in sizes.split(',')],
+                        help='comma separated body sizes')
+    args = parser.parse_args()
+
+    print('%-12s %10s %14s %14s' % ('algorithm', 'body', 'digest MB/s', 'verify MB/s'))
+    for size in args.sizes:
+        body = b'x' * size
+        for algorithm in available_algorithms():
+            print('%-12s %10d %14.1f %14.1f' % (algorithm, size, size / digest_throughput(algorithm, body) / 1024 ** 2,
+                                                size / verify_throughput(algorithm, body) / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
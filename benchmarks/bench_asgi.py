@@ -0,0 +1,112 @@
+"""Requests per second through tastypie_hmacauth.aio's middleware, under Django's ASGI handler
+
+Drives the ASGI application in process, ``--concurrency`` requests at a time, so no server
+is needed. Checks that signed requests are accepted and forged ones refused before timing
+them. Needs Python 3 and Django 3.1 or higher.
+
+    python benchmarks/bench_asgi.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import timeit
+
+from common import report, setup_django
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'hmacauth-bench-asgi.sqlite3')
+
+setup_django(
+    ROOT_URLCONF=__name__,
+    MIDDLEWARE=['tastypie_hmacauth.aio.HMACAuthenticationMiddleware'],
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': DATABASE}},
+)
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.urls import path
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.authentication import PRINCIPAL_ATTRIBUTE
+from tastypie_hmacauth.client import Signer
+
+PATH = '/api/v1/funcionario/'
+authentication = HMACAuthentication()
+
+
+def resource(request):
+    # what a Tastypie resource does, after checking the middleware verified the request first
+    verified = getattr(request, PRINCIPAL_ATTRIBUTE, None) is not None
+    return HttpResponse(status=200 if verified and authentication.is_authenticated(request) else 401)
+
+
+urlpatterns = [path(PATH.lstrip('/'), resource)]
+
+
+async def call(application, query_string):
+    """Sends a GET of PATH to ``application`` and returns the response status"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': PATH, 'raw_path': PATH.encode('ascii'),
+        'query_string': query_string.encode('ascii'), 'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # the client never disconnects
+        return await asyncio.get_running_loop().create_future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+async def run(application, query_string, requests, concurrency):
+    """Sends ``requests`` requests, ``concurrency`` at a time, and returns their statuses"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await call(application, query_string)
+    return await asyncio.gather(*[limited() for _ in range(requests)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', default=2000, type=int, help='requests per measurement')
+    parser.add_argument('--concurrency', default=50, type=int, help='requests in flight at once')
+    args = parser.parse_args()
+
+    if os.path.exists(DATABASE):
+        os.remove(DATABASE)
+    call_command('migrate', verbosity=0, interactive=False)
+    user = get_user_model().objects.create_user(username='benchmark', password='benchmark')
+
+    url, _ = Signer(user.pk, settings.SECRET_KEY).sign('GET', 'http://localhost' + PATH)
+    signed = url.split('?', 1)[1]
+    forged = signed.rsplit('api_key=', 1)[0] + 'api_key=' + '0' * 64
+    application = get_asgi_application()
+    loop = asyncio.new_event_loop()
+    try:
+        for label, query_string, status in (('signed GET', signed, 200), ('forged GET', forged, 401)):
+            assert loop.run_until_complete(call(application, query_string)) == status, label
+            start = timeit.default_timer()
+            statuses = loop.run_until_complete(run(application, query_string, args.requests, args.concurrency))
+            elapsed = timeit.default_timer() - start
+            assert statuses == [status] * args.requests, label
+            report('%s, %d in flight' % (label, args.concurrency), elapsed / args.requests)
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
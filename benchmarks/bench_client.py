@@ -0,0 +1,32 @@
+"""Measures how many requests the client can sign per second"""
+from __future__ import print_function
+from io import BytesIO
+
+from common import measure, report, setup_django
+
+setup_django()
+
+from django.conf import settings
+from tastypie_hmacauth.client import HMACClient, Signer
+
+URL = 'http://localhost/api/v1/funcionario/?limit=20&offset=40'
+BODY = b'{"nome": "Funcionario", "patrao": "/api/v1/patrao/1/"}'
+LARGE_BODY = b'x' * (1024 * 1024)
+
+
+def main():
+    signer = Signer('1', settings.SECRET_KEY)
+    header_signer = Signer('1', settings.SECRET_KEY, mode='header')
+    report('sign GET', measure(lambda: signer.sign('GET', URL)))
+    report('sign GET, header mode', measure(lambda: header_signer.sign('GET', URL)))
+    report('sign POST', measure(lambda: signer.sign('POST', URL, BODY)))
+
+    large = BytesIO(LARGE_BODY)
+    report('sign POST, 1MB file body', measure(lambda: signer.sign('POST', URL, large), number=100))
+
+    client = HMACClient('http://localhost', '1', settings.SECRET_KEY)
+    report('HMACClient.prepare POST json', measure(lambda: client.prepare('POST', '/api/v1/patrao/', json={'a': 1})))
+
+
+if __name__ == '__main__':
+    main()
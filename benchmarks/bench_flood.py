@@ -0,0 +1,70 @@
+"""Rejected requests per second under a flood of garbage, by stage order
+
+Each kind of bad request is authenticated with the stage order HMACAuthentication used to
+have, signature first, with the default one, cheapest checks first, and with users looked
+up before hashing through a UserCache, which remembers unknown public keys.
+
+    python benchmarks/bench_flood.py --size 1MB --requests 200
+"""
+from __future__ import division, print_function
+import argparse
+import time
+from timeit import default_timer
+
+from common import parse_size, setup_test_project
+
+USER = setup_test_project()
+
+from django.test import RequestFactory
+from tastypie_hmacauth import HMACAuthentication, HMACAuthConfig, UserCache, metrics
+from tastypie_hmacauth.config import DEFAULT_STAGES
+
+LEGACY_STAGES = (metrics.SIGNATURE, metrics.USER_LOOKUP, metrics.TIMESTAMP, metrics.REPLAY)
+USER_FIRST_STAGES = (metrics.TIMESTAMP, metrics.USER_LOOKUP, metrics.SIGNATURE, metrics.REPLAY)
+STALE = '2015-08-17T10:10:10'
+
+
+def flood(size):
+    """Returns (label, request factory) pairs, one per kind of garbage"""
+    now = str(int(time.time()))
+    body = b'x' * size
+    factory = RequestFactory()
+
+    def post(public_key, timestamp):
+        path = '/api/v1/patrao/?public_key=%s&timestamp=%s&api_key=%s' % (public_key, timestamp, '0' * 64)
+        return lambda: factory.post(path, data=body, content_type='application/json')
+
+    return [
+        ('stale timestamp', post(USER.pk, STALE)),
+        ('malformed timestamp', post(USER.pk, 'garbage')),
+        ('bad signature', post(USER.pk, now)),
+        ('unknown public key', post(999999, now)),
+    ]
+
+
+def rejected_per_second(auth, make_request, count):
+    requests = [make_request() for _ in range(count)]
+    start = default_timer()
+    for request in requests:
+        assert not auth.is_authenticated(request)
+    return count / (default_timer() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='1MB', type=parse_size, help='body size of each request')
+    parser.add_argument('--requests', default=200, type=int)
+    args = parser.parse_args()
+
+    legacy = HMACAuthentication(config=HMACAuthConfig(stages=LEGACY_STAGES))
+    default = HMACAuthentication(config=HMACAuthConfig(stages=DEFAULT_STAGES))
+    user_first = HMACAuthentication(config=HMACAuthConfig(stages=USER_FIRST_STAGES, user_cache=UserCache()))
+    print('%-24s %14s %14s %14s' % ('garbage', 'legacy/s', 'default/s', 'user first/s'))
+    for label, make_request in flood(args.size):
+        print('%-24s %14.0f %14.0f %14.0f' % (label, rejected_per_second(legacy, make_request, args.requests),
+                                              rejected_per_second(default, make_request, args.requests),
+                                              rejected_per_second(user_first, make_request, args.requests)))
+
+
+if __name__ == '__main__':
+    main()
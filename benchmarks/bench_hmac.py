@@ -0,0 +1,57 @@
+"""Compares keying an HMAC per request with copying a precomputed keyed state"""
+from __future__ import print_function
+import hashlib
+import hmac
+import operator
+
+from common import measure, report, setup_django
+
+setup_django()
+
+from django.conf import settings
+from django.test import RequestFactory
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.signing import keyed_hmac
+
+PATH = '/api/v1/funcionario/'
+QUERY = {'public_key': '1', 'timestamp': '2015-08-17T10:10:10', 'limit': '20', 'offset': '40'}
+
+
+def legacy_is_api_key_valid(api_key, request):
+    """is_api_key_valid as it was before keyed states were reused"""
+    params = sorted(request.GET.copy().items(), key=operator.itemgetter(0))
+    query_string = '?'
+    for t in params:
+        if t[0] != 'api_key':
+            query_string = query_string + t[0] + '=' + t[1] + '&'
+    url = 'http://' + request.META.get('HTTP_HOST', 'localhost') + request.META['PATH_INFO'] + query_string
+    url = url[:len(url) - 1]
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), url.encode('utf-8'), hashlib.sha256).hexdigest()
+    return digest == api_key
+
+
+def main():
+    url = ('http://localhost' + PATH + '?' + '&'.join('%s=%s' % item for item in sorted(QUERY.items()))).encode('utf-8')
+    key = settings.SECRET_KEY.encode('utf-8')
+
+    report('hmac.new per request', measure(lambda: hmac.new(key, url, hashlib.sha256).hexdigest()))
+
+    def copied():
+        digest_maker = keyed_hmac(settings.SECRET_KEY)
+        digest_maker.update(url)
+        return digest_maker.hexdigest()
+    report('keyed_hmac (copy of keyed state)', measure(copied))
+
+    api_key = hmac.new(key, url, hashlib.sha256).hexdigest()
+    query = dict(QUERY, api_key=api_key)
+    request = RequestFactory().get(PATH, query)
+    auth = HMACAuthentication()
+
+    assert legacy_is_api_key_valid(api_key, request)
+    assert auth.is_api_key_valid(api_key, request)
+    report('legacy is_api_key_valid', measure(lambda: legacy_is_api_key_valid(api_key, request)))
+    report('is_api_key_valid', measure(lambda: auth.is_api_key_valid(api_key, request, '1')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Benchmarks the HMACAuthentication pipeline, stage by stage and end to end
+
+Every combination of method, query parameter count, body size and thread count is run
+twice: calling HMACAuthentication.is_authenticated directly on RequestFactory requests,
+and through test_project's WSGI application. Direct runs also time each stage alone.
+
+    python benchmarks/bench_pipeline.py --sizes 1KB,1MB,50MB --threads 1,4
+    python benchmarks/bench_pipeline.py --json before.json
+    python benchmarks/bench_pipeline.py --compare before.json --tolerance 0.2
+
+With --compare the script exits with status 1 if any case lost more than ``tolerance``
+of its throughput.
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import sys
+import threading
+import time
+from timeit import default_timer
+
+from common import UNITS, parse_size, setup_test_project
+
+USER = setup_test_project()
+
+from django.conf import settings
+from django.test import RequestFactory
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from test_project.wsgi import application
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.canonical import BODY_METHODS, canonical_url, request_canonical_url
+from tastypie_hmacauth.signing import keyed_hmac
+
+STAGES = ('extract', 'canonicalize', 'hmac', 'user lookup', 'timestamp')
+# large bodies get fewer iterations, so every case hashes roughly this much data
+BYTES_PER_CASE = 256 * 1024 ** 2
+
+
+def format_size(size):
+    for unit in ('MB', 'KB'):
+        if size >= UNITS[unit]:
+            return '%g%s' % (size / UNITS[unit], unit)
+    return '%dB' % size
+
+
+def payload(method, size):
+    if method not in BODY_METHODS:
+        return b''
+    body = {'first_name': 'benchmark', 'usuario': '/api/v1/usuario/%s/' % USER.pk}
+    overhead = len(json.dumps(dict(body, padding='')))
+    return json.dumps(dict(body, padding='x' * max(size - overhead, 0))).encode('utf-8')
+
+
+def endpoint(method):
+    # POST creates a Patrao for the benchmark user, the other methods work on the user itself
+    return '/api/v1/patrao/' if method == 'POST' else '/api/v1/usuario/%s/' % USER.pk
+
+
+def signed_path(method, params, body):
+    query = [('p%03d' % i, 'value%d' % i) for i in range(params)]
+    query += [('public_key', str(USER.pk)), ('timestamp', str(int(time.time())))]
+    query_string = '&'.join('%s=%s' % pair for pair in query)
+    path = endpoint(method)
+
+    digest_maker = keyed_hmac(settings.SECRET_KEY)
+    digest_maker.update(canonical_url('http', 'localhost', path, query_string))
+    digest_maker.update(body)
+    return '%s?%s&api_key=%s' % (path, query_string, digest_maker.hexdigest())
+
+
+def make_request(method, path, body):
+    factory = RequestFactory()
+    if method in BODY_METHODS:
+        return getattr(factory, method.lower())(path, data=body, content_type='application/json')
+    return getattr(factory, method.lower())(path)
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def time_stages(auth, method, path, body, iterations):
+    """Times each stage of the pipeline on its own, on fresh requests"""
+    timings = dict((stage, []) for stage in STAGES)
+    for _ in range(iterations):
+        request = make_request(method, path, body)
+
+        start = default_timer()
+        public_key, api_key, timestamp = auth.extract_credentials(request)
+        timings['extract'].append(default_timer() - start)
+
+        start = default_timer()
+        url = request_canonical_url(request)
+        timings['canonicalize'].append(default_timer() - start)
+
+        start = default_timer()
+        digest_maker = keyed_hmac(settings.SECRET_KEY)
+        digest_maker.update(url)
+        if method in BODY_METHODS:
+            auth.hash_body(request, digest_maker)
+        assert digest_maker.hexdigest() == api_key
+        timings['hmac'].append(default_timer() - start)
+
+        start = default_timer()
+        auth.get_user(public_key)
+        timings['user lookup'].append(default_timer() - start)
+
+        start = default_timer()
+        auth.is_timestamp_valid(timestamp)
+        timings['timestamp'].append(default_timer() - start)
+    return dict((stage, percentile(samples, 0.5)) for stage, samples in timings.items())
+
+
+def run_threads(target, batches):
+    """Runs ``target(batch)`` on one thread per batch and returns the requests per second"""
+    workers = [threading.Thread(target=target, args=(batch,)) for batch in batches]
+    start = default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(len(batch) for batch in batches) / (default_timer() - start)
+
+
+def run_direct(auth, method, path, body, threads, iterations):
+    failures = []
+    per_thread = max(iterations // threads, 1)
+    batches = [[make_request(method, path, body) for _ in range(per_thread)] for _ in range(threads)]
+
+    def target(requests):
+        for request in requests:
+            if not auth.is_authenticated(request):
+                failures.append(request)
+
+    throughput = run_threads(target, batches)
+    if failures:
+        raise AssertionError('%d requests failed to authenticate' % len(failures))
+    return throughput
+
+
+def run_wsgi(method, path, body, threads, iterations):
+    failures = []
+    per_thread = max(iterations // threads, 1)
+    batches = [[Client(application, BaseResponse)] * per_thread for _ in range(threads)]
+
+    def target(clients):
+        for client in clients:
+            response = client.open(path, method=method, data=body, content_type='application/json')
+            if response.status_code >= 400:
+                failures.append(response.status_code)
+
+    throughput = run_threads(target, batches)
+    if failures:
+        raise AssertionError('%d requests failed with %s' % (len(failures), sorted(set(failures))))
+    return throughput
+
+
+def run(args):
+    auth = HMACAuthentication()
+    results = []
+    header = '%-6s %6s %8s %7s ' % ('method', 'params', 'body', 'threads')
+    header += ' '.join('%12s' % stage for stage in STAGES) + ' %12s %12s' % ('direct/s', 'wsgi/s')
+    print(header)
+    print('-' * len(header))
+
+    for method in args.methods:
+        for size in (args.sizes if method in BODY_METHODS else [0]):
+            body = payload(method, size)
+            iterations = max(min(args.iterations, BYTES_PER_CASE // max(len(body), 1)), args.min_iterations)
+            for params in args.params:
+                path = signed_path(method, params, body)
+                stages = time_stages(auth, method, path, body, iterations)
+                for threads in args.threads:
+                    result = {
+                        'method': method, 'params': params, 'body': size, 'threads': threads,
+                        'stages': stages,
+                        'direct': run_direct(auth, method, path, body, threads, iterations),
+                        'wsgi': run_wsgi(method, path, body, threads, iterations),
+                    }
+                    results.append(result)
+                    line = '%-6s %6d %8s %7d ' % (method, params, format_size(size) if body else '-', threads)
+                    line += ' '.join('%10.1fus' % (stages[stage] * 1e6) for stage in STAGES)
+                    line += ' %12.0f %12.0f' % (result['direct'], result['wsgi'])
+                    print(line)
+                    sys.stdout.flush()
+    return results
+
+
+def case_key(result):
+    return result['method'], result['params'], result['body'], result['threads']
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = dict((case_key(result), result) for result in json.load(baseline_file))
+
+    regressions = 0
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        for mode in ('direct', 'wsgi'):
+            if result[mode] < before[mode] * (1 - tolerance):
+                regressions += 1
+                print('REGRESSION %s %s: %.0f/s, was %.0f/s' % (mode, case_key(result), result[mode], before[mode]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--methods', default='GET,POST,PUT,PATCH', type=lambda value: value.upper().split(','))
+    parser.add_argument('--params', default='0,10,100', type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--sizes', default='1KB,64KB,1MB,10MB,50MB',
+                        type=lambda value: [parse_size(v) for v in value.split(',')])
+    parser.add_argument('--threads', default='1,4,16', type=lambda value: [int(v) for v in value.split(',')])
+    parser.add_argument('--iterations', default=500, type=int)
+    parser.add_argument('--min-iterations', default=5, type=int)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results of a previous --json run to compare with')
+    parser.add_argument('--tolerance', default=0.2, type=float)
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
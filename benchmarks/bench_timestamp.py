@@ -0,0 +1,36 @@
+"""Requests per second of the timestamp stage, before and after dropping strptime/mktime"""
+from __future__ import print_function
+import time
+from datetime import datetime
+
+from common import measure, report, setup_django
+
+setup_django()
+
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.timestamps import TIMESTAMP_FORMAT
+
+
+def legacy_is_timestamp_valid(timestamp, timestamp_window=5):
+    """is_timestamp_valid as it was with strptime and mktime"""
+    timestamp_server = datetime.utcnow()
+    timestamp_client = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    d1_ts = time.mktime(timestamp_client.timetuple())
+    d2_ts = time.mktime(timestamp_server.timetuple())
+    return int(d2_ts - d1_ts) // 60 <= timestamp_window
+
+
+def main():
+    auth = HMACAuthentication()
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    epoch = str(int(time.time()))
+    epoch_ms = str(int(time.time() * 1000))
+
+    report('legacy is_timestamp_valid (strptime)', measure(lambda: legacy_is_timestamp_valid(now)))
+    report('is_timestamp_valid (ISO-8601)', measure(lambda: auth.is_timestamp_valid(now)))
+    report('is_timestamp_valid (epoch seconds)', measure(lambda: auth.is_timestamp_valid(epoch)))
+    report('is_timestamp_valid (epoch milliseconds)', measure(lambda: auth.is_timestamp_valid(epoch_ms)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Authenticated requests per second with a token versus a full HMAC signature
+
+    python benchmarks/bench_tokens.py --size 64KB
+"""
+from __future__ import print_function
+import argparse
+
+from common import measure, parse_size, report, setup_test_project
+
+USER = setup_test_project()
+
+from django.conf import settings
+from django.test import RequestFactory
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.client import Signer
+from tastypie_hmacauth.principals import Principal
+from tastypie_hmacauth.tokens import TokenSigner
+
+PATH = '/api/v1/funcionario/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='64KB', type=parse_size, help='body size of the POST requests')
+    args = parser.parse_args()
+
+    tokens = TokenSigner()
+    auth = HMACAuthentication(tokens=tokens)
+    token = tokens.issue(Principal(USER.pk))[0]
+    signer = Signer(USER.pk, settings.SECRET_KEY)
+    factory = RequestFactory()
+    body = b'x' * args.size
+
+    def signed(method):
+        url, _ = signer.sign(method, 'http://localhost' + PATH, body if method == 'POST' else None)
+        if method == 'POST':
+            return lambda: factory.post(url[len('http://localhost'):], data=body, content_type='application/json')
+        return lambda: factory.get(url[len('http://localhost'):])
+
+    def with_token(method):
+        if method == 'POST':
+            return lambda: factory.post(PATH, data=body, content_type='application/json',
+                                        HTTP_AUTHORIZATION='HMACToken ' + token)
+        return lambda: factory.get(PATH, HTTP_AUTHORIZATION='HMACToken ' + token)
+
+    for method in ('GET', 'POST'):
+        for label, make_request in (('hmac', signed(method)), ('token', with_token(method))):
+            assert auth.is_authenticated(make_request())
+            report('%s %s' % (method, label), measure(lambda: auth.is_authenticated(make_request()), number=200))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Shared helpers for the benchmark scripts in this directory
+
+The scripts run against a minimal in-memory Django project, so nothing but Django and
+Tastypie has to be installed. Run them from the repository root, e.g.::
+
+    python benchmarks/bench_hmac.py
+"""
+from __future__ import print_function
+import hashlib
+import hmac
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SECRET_KEY = '^5bic*(s7lrx9i%-hsa%z7o2w%+ms85cq8_tqo%1vyaazv#dmh'
+SECRET_ID = hmac.new(SECRET_KEY.encode('utf-8'), SECRET_KEY.encode('utf-8'), hashlib.sha1).hexdigest()
+
+UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'B': 1}
+
+
+def setup_django(**overrides):
+    import django
+    from django.conf import settings
+
+    if not settings.configured:
+        options = dict(
+            SECRET_KEY=SECRET_KEY,
+            SECRET_ID=SECRET_ID,
+            DEBUG=False,
+            ALLOWED_HOSTS=['*'],
+            INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes'],
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            USE_TZ=True,
+        )
+        options.update(overrides)
+        settings.configure(**options)
+        django.setup()
+
+
+def setup_test_project():
+    """Sets test_project up on a fresh database and returns a user to sign requests as"""
+    import django
+
+    sys.path.insert(0, os.path.join(ROOT, 'test_project'))
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'project_settings'
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from tastypie.compat import get_user_model
+
+    if os.path.exists(settings.DATABASES['default']['NAME']):
+        os.remove(settings.DATABASES['default']['NAME'])
+    call_command('migrate', verbosity=0, interactive=False)
+    return get_user_model().objects.create_user(username='benchmark', password='benchmark')
+
+
+def parse_size(size):
+    """Parses sizes such as '512', '64KB' or '1.5MB' into bytes"""
+    size = size.strip().upper()
+    for unit, factor in sorted(UNITS.items(), key=lambda item: -len(item[0])):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def measure(func, number=10000, repeat=5):
+    """Returns the best time, in seconds, of a single call to ``func``"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(label, seconds):
+    print('%-48s %10.2f us/call %12.0f calls/s' % (label, seconds * 1e6, 1 / seconds))
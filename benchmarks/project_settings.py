@@ -0,0 +1,15 @@
+"""test_project settings, on a throwaway database the benchmark threads can share"""
+import os
+import tempfile
+
+from test_project.settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'hmacauth-benchmarks.sqlite3'),
+    }
+}
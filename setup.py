@@ -99,6 +99,7 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'client': ['requests'],
     },
 
     # To provide executable scripts, use entry points in preference to the
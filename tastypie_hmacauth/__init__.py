@@ -1,3 +1,35 @@
+import sys
+from importlib import import_module
+
 __version__ = "0.1"
 
-from .authentication import HMACAuthentication
+default_app_config = 'tastypie_hmacauth.apps.HMACAuthAppConfig'
+
+# imported on first use, so client, canonical, digests and signing can be imported by
+# programs without Django settings
+_exports = {
+    'HMACAuthentication': 'authentication',
+    'HMACAuthConfig': 'config',
+    'UserCache': 'cache',
+}
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    return getattr(import_module('.' + _exports[name], __name__), name)
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ before PEP 562: stand in a module that has one, keeping a
+    # reference to this one so its globals aren't cleared
+    import types
+
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+    _module = sys.modules[__name__]
+    sys.modules[__name__] = _LazyModule(__name__)
+    sys.modules[__name__].__dict__.update(_module.__dict__)
+    sys.modules[__name__]._module = _module
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import ClientSecret
+
+
+class ClientSecretAdmin(admin.ModelAdmin):
+    list_display = ('user', 'is_active', 'created')
+    list_filter = ('is_active',)
+    raw_id_fields = ('user',)
+
+
+admin.site.register(ClientSecret, ClientSecretAdmin)
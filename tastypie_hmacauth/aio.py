@@ -0,0 +1,105 @@
+"""HMAC authentication for ASGI deployments
+
+Needs Python 3 and Django 3.1 or higher, so the package doesn't import it.
+
+Tastypie resources are synchronous, so the async work happens in a middleware placed in
+front of them: it verifies the request without blocking the event loop and leaves the
+result on the request, where HMACAuthentication.is_authenticated picks it up.
+
+    MIDDLEWARE = [
+        ...
+        'tastypie_hmacauth.aio.HMACAuthenticationMiddleware',
+    ]
+
+    HMACAUTH_MIDDLEWARE_OPTIONS = {'timestamp_window': 5}
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from tastypie.exceptions import ImmediateHttpResponse
+
+from . import metrics
+from .authentication import HMACAuthentication
+from .canonical import BODY_METHODS
+from .nonces import LocalNonceStore
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHMACAuthentication(HMACAuthentication):
+    """HMACAuthentication with an ``ais_authenticated`` coroutine
+
+    The leading stages that can't block run on the event loop, so most garbage is rejected
+    without leaving it. The rest of the pipeline, HMACAuthentication.authenticate, then runs
+    in a single sync_to_async call on Django's sync thread, like the async ORM methods do.
+    Stages block when they query the database or a cache, or hash a body larger than
+    ``offload_threshold`` bytes. Django's ASGI handler has already spooled the whole body
+    by the time a middleware runs, so reading it never waits on the client.
+    """
+
+    def __init__(self, *args, offload_threshold=64 * 1024, **kwargs):
+        super(AsyncHMACAuthentication, self).__init__(*args, **kwargs)
+        self.offload_threshold = offload_threshold
+
+    async def ais_authenticated(self, request, **kwargs):
+        settled = self.settle(request)
+        if settled is not None:
+            return settled
+
+        try:
+            credentials = self._run_stage(metrics.EXTRACT, self.extract_credentials, request)
+        except ImmediateHttpResponse:
+            return self._failed(metrics.MISSING_CREDENTIAL)
+        except Exception:
+            logger.exception('HMAC authentication raised')
+            return self._failed(metrics.ERROR)
+
+        stages = list(self.stages)
+        if self.verification_key(request, *credentials) is None:
+            on_loop = []
+            while stages and not self._offloads(stages[0], request):
+                on_loop.append(stages.pop(0))
+            reason, _ = self.run_stages(request, on_loop, credentials)
+            if reason is not None:
+                return self._failed(reason)
+        # USER_LOOKUP always blocks, so there is always something left for Django's sync thread
+        return await sync_to_async(self.authenticate)(request, stages, credentials)
+
+    def _offloads(self, stage, request):
+        """Whether ``stage`` may block, and so has to leave the event loop"""
+        if stage == metrics.SIGNATURE:
+            return not self.keyring.is_loaded() or self._body_length(request) > self.offload_threshold
+        if stage == metrics.USER_LOOKUP:
+            return True
+        if stage == metrics.REPLAY:
+            return self._nonce_does_io()
+        return False
+
+    def _nonce_does_io(self):
+        return self.nonce_store is not None and not isinstance(self.nonce_store, LocalNonceStore)
+
+    def _body_length(self, request):
+        if request.method not in BODY_METHODS:
+            return 0
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+
+class HMACAuthenticationMiddleware(object):
+    """Verifies HMAC signed requests on the event loop, before they reach Tastypie
+
+    Requests that fail are let through untouched, the resources reject them as usual.
+    """
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.authentication = AsyncHMACAuthentication(**getattr(settings, 'HMACAUTH_MIDDLEWARE_OPTIONS', {}))
+
+    async def __call__(self, request):
+        await self.authentication.ais_authenticated(request)
+        return await self.get_response(request)
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+import logging
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+
+class HMACAuthAppConfig(AppConfig):
+    """Warms principals and secrets up when settings.HMACAUTH_WARMUP is set, see warmup"""
+    name = 'tastypie_hmacauth'
+    verbose_name = 'HMAC authentication'
+
+    def ready(self):
+        options = getattr(settings, 'HMACAUTH_WARMUP', None)
+        if options is None:
+            return
+
+        from . import warmup
+
+        options = dict(options)
+        refresh_interval = options.pop('refresh_interval', None)
+        try:
+            loaded = warmup.warm_up(**options)
+        except DatabaseError:
+            # e.g. manage.py migrate on a fresh database
+            logger.warning('HMAC principals were not warmed up, the database is not ready')
+        else:
+            logger.info('Warmed up %d HMAC principals', loaded)
+        if refresh_interval:
+            warmup.start_refresher(refresh_interval, **options)
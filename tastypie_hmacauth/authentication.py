@@ -1,28 +1,75 @@
 from __future__ import unicode_literals
-import hmac
 import hashlib
+import logging
 import time
-from datetime import datetime
+from io import BytesIO
+from timeit import default_timer
 
 from django.conf import settings
-from tastypie.http import HttpUnauthorized, HttpBadRequest
-from tastypie.compat import get_user_model
+from django.utils.encoding import force_bytes
+from django.utils.functional import SimpleLazyObject
+from tastypie.http import HttpBadRequest
 from tastypie.authentication import Authentication
 from tastypie.exceptions import ImmediateHttpResponse
-import pprint, operator
+from . import metrics
+from .canonical import BODY_METHODS, request_canonical_url, request_scheme
+from .compat import compare_digest, force_text
+from .config import HMACAuthConfig, HEADER_MODE
+from .digests import BODY_DIGEST_META, DIGEST_SIGNING_PREFIX, DigestVerifyingStream, digest_mismatch
+from .principals import fetch_principals, secret_id_principal, to_pk
+from .signing import DEFAULT_ALGORITHM, keyed_digest
+from .tokens import token_from_request
+from .timestamps import parse_timestamp
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+
+logger = logging.getLogger(__name__)
+
+# where a request already verified, e.g. by aio.HMACAuthenticationMiddleware, keeps its principal
+PRINCIPAL_ATTRIBUTE = '_hmacauth_principal'
+
+
+def _option(name):
+    return property(lambda self: getattr(self.config, name), doc='Read from self.config')
 
 
 class HMACAuthentication(Authentication):
-    """A keyed-hash message authentication for Tastypie and Django"""
+    """A keyed-hash message authentication for Tastypie and Django
 
-    def __init__(self, require_active=True, timestamp_window=5):
-        self.require_active = require_active
-        self.timestamp_window = timestamp_window
+    Takes the keyword arguments of HMACAuthConfig, or a ``config`` to share with other
+    resources. The instance keeps no state of its own, everything a request needs stays
+    local to is_authenticated or on the request, so one can serve any number of threads.
+    """
 
-    def _unauthorized(self):
-        return HttpUnauthorized()
+    require_active = _option('require_active')
+    timestamp_window = _option('timestamp_window')
+    user_cache = _option('user_cache')
+    body_chunk_size = _option('body_chunk_size')
+    keyring = _option('keyring')
+    nonce_store = _option('nonce_store')
+    mode = _option('mode')
+    verification_cache = _option('verification_cache')
+    instrumentation = _option('instrumentation')
+    body_digest = _option('body_digest')
+    defer_body_digest = _option('defer_body_digest')
+    stages = _option('stages')
+    algorithms = _option('algorithms')
+    tokens = _option('tokens')
+
+    def __init__(self, *args, **kwargs):
+        config = kwargs.pop('config', None)
+        if config is None:
+            config = HMACAuthConfig(*args, **kwargs)
+        elif args:
+            raise TypeError('options must be passed by keyword along with config')
+        elif kwargs:
+            config = config.replace(**kwargs)
+        self.config = config
 
     def extract_credentials(self, request):
+        if self.mode == HEADER_MODE:
+            return self.extract_header_credentials(request)
+
         public_key = request.GET.get('public_key') or request.POST.get('public_key')
         if public_key is None:
             raise ImmediateHttpResponse(response=HttpBadRequest('public_key not found'))
@@ -37,74 +84,389 @@ class HMACAuthentication(Authentication):
 
         return public_key, api_key, timestamp
 
+    def extract_header_credentials(self, request):
+        """Reads ``Authorization: HMAC <public_key>:<api_key>:<timestamp>``
+
+        Neither the query string nor the body are looked at, so the URL stays cacheable
+        and form bodies are not parsed.
+        """
+        credentials = self._header_fields(request)[0].split(':', 2)
+        if len(credentials) != 3 or not all(credentials):
+            raise ImmediateHttpResponse(response=HttpBadRequest('Malformed HMAC Authorization header'))
+
+        return tuple(credentials)
+
+    def _header_fields(self, request):
+        """Splits the HMAC Authorization header into its credentials and its ``key=value`` parameters"""
+        auth_type, _, data = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if auth_type.lower() != 'hmac':
+            raise ImmediateHttpResponse(response=HttpBadRequest('HMAC Authorization header not found'))
+
+        fields = data.split()
+        params = dict(field.partition('=')[::2] for field in fields[1:])
+        if not fields or set(params) - set(['algorithm']) or not all(params.values()):
+            raise ImmediateHttpResponse(response=HttpBadRequest('Malformed HMAC Authorization header'))
+        return fields[0], params
+
+    def extract_algorithm(self, request):
+        """Returns the signature algorithm the request names, None if it names none
+
+        The ``algorithm`` query parameter, or ``algorithm=<name>`` after the credentials
+        of the Authorization header. Either way the signature covers it.
+        """
+        if self.mode == HEADER_MODE:
+            return self._header_fields(request)[1].get('algorithm')
+        return request.GET.get('algorithm') or request.POST.get('algorithm')
+
     def is_authenticated(self, request, **kwargs):
+        settled = self.settle(request)
+        if settled is not None:
+            return settled
+        return self.authenticate(request, self.stages)
+
+    def settle(self, request):
+        """Answers requests that need no stage, already verified ones and tokens, None for the others"""
+        principal = getattr(request, PRINCIPAL_ATTRIBUTE, None)
+        if principal is not None:
+            return self.is_principal_valid(principal)
+
+        token = token_from_request(request) if self.tokens is not None else None
+        if token is not None:
+            return self.is_token_valid(request, token)
+        return None
+
+    def authenticate(self, request, stages, credentials=None):
+        """Verifies a signed request by running ``stages`` on it, in order
 
+        ``credentials`` are the request's (public_key, api_key, timestamp), extracted here
+        when not given. Requests found in the verification_cache, which keeps the principals
+        of verified requests, only have their user looked up again. On success the principal
+        is remembered on the request.
+        """
         try:
-            public_key, api_key, timestamp = self.extract_credentials(request)
-            if not self.is_api_key_valid(api_key, request) or \
-                not self.check_active(self.get_user(public_key)) or \
-                    not self.is_timestamp_valid(timestamp):
-                        return False
+            if credentials is None:
+                try:
+                    credentials = self._run_stage(metrics.EXTRACT, self.extract_credentials, request)
+                except ImmediateHttpResponse:
+                    return self._failed(metrics.MISSING_CREDENTIAL)
+            public_key, api_key, timestamp = credentials
 
-        except Exception, e:
-            return False
+            verification_key = self.verification_key(request, public_key, api_key, timestamp)
+            if verification_key is not None and self.verification_cache.get(verification_key) is not None:
+                # the signature needn't be checked again, but the user may have been deactivated since
+                stages = (metrics.USER_LOOKUP, metrics.REPLAY)
+                verification_key = None
 
+            reason, principal = self.run_stages(request, stages, credentials)
+            if reason is not None:
+                return self._failed(reason)
+
+            if verification_key is not None:
+                self.verification_cache.set(verification_key, principal, expires_at=self.timestamp_expiry(timestamp))
+
+        except Exception:
+            logger.exception('HMAC authentication raised')
+            return self._failed(metrics.ERROR)
+
+        self.remember_principal(request, principal)
+        return self._succeeded()
+
+    def run_stages(self, request, stages, credentials):
+        """Runs ``stages`` on the request, returns the reason it failed, or None, and its principal
+
+        The principal is None unless metrics.USER_LOOKUP is one of ``stages``. A stage rejects
+        the request by raising ImmediateHttpResponse; any other exception is logged and
+        fails it with metrics.ERROR.
+        """
+        public_key, api_key, timestamp = credentials
+        principal = None
+        for stage in stages:
+            try:
+                check, args = self.stage_check(stage, request, public_key, api_key, timestamp)
+                result = self._run_stage(stage, check, *args)
+            except ImmediateHttpResponse:
+                return metrics.STAGE_REASONS[stage], None
+            except Exception:
+                logger.exception('HMAC authentication raised at its %s stage', stage)
+                return metrics.ERROR, None
+            if stage == metrics.USER_LOOKUP:
+                if result is None:
+                    return metrics.UNKNOWN_USER, None
+                if not self.check_active(result):
+                    return metrics.INACTIVE_USER, None
+                principal = result
+            elif not result:
+                return metrics.STAGE_REASONS[stage], None
+        return None, principal
+
+    def is_token_valid(self, request, token):
+        """Authenticates a request carrying a tokens.TokenSigner token, with no lookup at all"""
+        principal = self._run_stage(metrics.TOKEN, self.tokens.verify, token)
+        if principal is None:
+            return self._failed(metrics.INVALID_TOKEN)
+        self.remember_principal(request, principal)
+        return self._succeeded()
+
+    def get_identifier(self, request):
+        """The public key of the client, for throttles such as throttle.HMACThrottle"""
+        principal = getattr(request, PRINCIPAL_ATTRIBUTE, None)
+        if principal is not None:
+            return principal.pk
+        try:
+            return force_text(self.extract_credentials(request)[0])
+        except ImmediateHttpResponse:
+            return super(HMACAuthentication, self).get_identifier(request)
+
+    def stage_check(self, stage, request, public_key, api_key, timestamp):
+        """Returns the check ``stage`` runs and its arguments"""
+        if stage == metrics.TIMESTAMP:
+            return self.is_timestamp_valid, (timestamp,)
+        if stage == metrics.SIGNATURE:
+            return self.is_api_key_valid, (api_key, request, public_key)
+        if stage == metrics.USER_LOOKUP:
+            return self.get_user, (public_key,)
+        return self.is_nonce_valid, (api_key, timestamp)
+
+    def remember_principal(self, request, principal):
+        """Keeps the verified principal on the request, so it is verified only once
+
+        Other resources, nested ones or a middleware, then accept the request after
+        checking the principal against their own require_active. ``request.user`` becomes
+        the principal's User, loaded the first time it is used.
+        """
+        setattr(request, PRINCIPAL_ATTRIBUTE, principal)
+        if not principal.is_secret_id:
+            request.user = SimpleLazyObject(principal.load_user)
+
+    def is_principal_valid(self, principal):
+        try:
+            if self.check_active(principal):
+                return self._succeeded()
+        except Exception:
+            logger.exception('HMAC authentication raised checking a verified principal')
+            return self._failed(metrics.ERROR)
+        return self._failed(metrics.INACTIVE_USER)
+
+    def _run_stage(self, stage, check, *args):
+        if self.instrumentation is None:
+            return check(*args)
+
+        start = default_timer()
+        try:
+            return check(*args)
+        finally:
+            self.instrumentation.observe(stage, default_timer() - start)
+
+    def record_result(self, reason):
+        """Reports a verification made outside is_authenticated, e.g. by batch.BatchVerifier
+
+        ``reason`` is one of the failure reasons in metrics, None for a valid request. Returns
+        whether the request was valid.
+        """
+        if reason is None:
+            return self._succeeded()
+        return self._failed(reason)
+
+    def _succeeded(self):
+        if self.instrumentation is not None:
+            self.instrumentation.succeeded()
         return True
 
-    def is_api_key_valid(self, api_key, request):
-
-        protocol = 'http://'
-        if 'https' in request.scheme or \
-            'HTTP_X_FORWARDED_PROTO' in request.META and 'https' in request.META['HTTP_X_FORWARDED_PROTO']:
-                protocol = 'https://'
-
-        host = request.META['HTTP_HOST'] if 'HTTP_HOST' in request.META else 'localhost'  # ResourceTestCase api_client does not set HTTP_HOST
-        path = request.META['PATH_INFO']
-
-        params = request.GET.copy()
-        params = sorted(params.items(), key=operator.itemgetter(0))
-        query_string = '?'
-        for t in params:
-            if t[0] != 'api_key':
-                query_string = query_string + t[0] + '=' + t[1] + '&'
-
-        url = protocol + host + path + query_string
-        url = url[:len(url) - 1]
-        if request.method == 'POST' or request.method == 'PUT' or request.method == 'PATCH':
-            url += request.body.decode('utf-8')
-        digest = hmac.new(settings.SECRET_KEY, url.encode('utf-8'), hashlib.sha256).hexdigest()
-        if digest != api_key:
+    def _failed(self, reason):
+        if self.instrumentation is not None:
+            self.instrumentation.failed(reason)
+        return False
+
+    def verification_key(self, request, public_key, api_key, timestamp):
+        """Returns the verification_cache key of an idempotent request, None if it can't be cached
+
+        The key holds everything the signature covers but the body, which GET and HEAD don't have.
+        """
+        if self.verification_cache is None or request.method not in CACHEABLE_METHODS:
+            return None
+        return (request.method, request_scheme(request), request.META.get('HTTP_HOST', ''),
+                request.META.get('PATH_INFO', ''), request.META.get('QUERY_STRING', ''),
+                public_key, api_key, timestamp, self.extract_algorithm(request))
+
+    def is_api_key_valid(self, api_key, request, public_key=None):
+
+        algorithm = self.extract_algorithm(request)
+        extra = ()
+        if self.mode == HEADER_MODE:
+            # the header is not part of the URL, so its credentials are signed as if they were
+            public_key, _, timestamp = self.extract_header_credentials(request)
+            extra = (('public_key', public_key), ('timestamp', timestamp))
+            if algorithm is not None:
+                extra += (('algorithm', algorithm),)
+        elif public_key is None:
+            public_key = self.extract_credentials(request)[0]
+        algorithm = algorithm or DEFAULT_ALGORITHM
+        if algorithm not in self.algorithms:
+            raise ImmediateHttpResponse(response=HttpBadRequest('algorithm is not supported'))
+        secrets = self.keyring.get_secrets(public_key)
+        if not secrets:
             raise ImmediateHttpResponse(response=HttpBadRequest('api_key is not valid'))
-        return True
+
+        url = request_canonical_url(request, extra)
+        signed_digest = self.signed_body_digest(request)
+        digest_makers = []
+        for secret in secrets:
+            digest_maker = keyed_digest(secret, algorithm)
+            if signed_digest is not None:
+                digest_maker.update(DIGEST_SIGNING_PREFIX)
+            digest_maker.update(url)
+            digest_makers.append(digest_maker)
+        if signed_digest is not None:
+            for digest_maker in digest_makers:
+                digest_maker.update(signed_digest)
+        elif request.method in BODY_METHODS:
+            self.hash_body(request, *digest_makers)
+        api_key = force_bytes(api_key)
+        for digest_maker in digest_makers:
+            if compare_digest(force_bytes(digest_maker.hexdigest()), api_key):
+                if signed_digest is not None:
+                    self.verify_body_digest(request, signed_digest)
+                return True
+        raise ImmediateHttpResponse(response=HttpBadRequest('api_key is not valid'))
+
+    def signed_body_digest(self, request):
+        """Returns the Content-SHA256 the signature covers instead of the body, None if there is none"""
+        if not self.body_digest or request.method not in BODY_METHODS:
+            return None
+        digest = request.META.get(BODY_DIGEST_META)
+        if not digest:
+            return None
+        return force_bytes(digest.strip().lower())
+
+    def verify_body_digest(self, request, expected):
+        """Checks the body against its signed digest, or wraps the body stream to check it when read
+
+        Checks are deferred only with defer_body_digest and while nobody has read the body yet.
+        """
+        expected = expected.decode('ascii')
+        if self.defer_body_digest and not hasattr(request, '_body') and not getattr(request, '_read_started', False):
+            request._stream = DigestVerifyingStream(request._stream, expected)
+            return
+
+        digest_maker = hashlib.sha256()
+        self.hash_body(request, digest_maker)
+        if digest_maker.hexdigest() != expected:
+            raise digest_mismatch()
+
+    def hash_body(self, request, *digest_makers):
+        """Feeds the request body to ``digest_makers`` without decoding or concatenating it
+
+        If nobody has read the body yet, it is consumed from the WSGI input in chunks of
+        ``body_chunk_size`` bytes and then handed back to Django as ``request.body``, so
+        Tastypie can still deserialize it and only one full copy of the payload is kept.
+        """
+        if hasattr(request, '_body') or getattr(request, '_read_started', False):
+            for digest_maker in digest_makers:
+                digest_maker.update(request.body)
+            return
+
+        chunks = []
+        chunk = request.read(self.body_chunk_size)
+        while chunk:
+            for digest_maker in digest_makers:
+                digest_maker.update(chunk)
+            chunks.append(chunk)
+            chunk = request.read(self.body_chunk_size)
+
+        request._body = b''.join(chunks)
+        request._stream = BytesIO(request._body)
 
     def get_user(self, public_key):
+        """Returns the Principal of ``public_key``, None if no user holds it"""
 
         if public_key == settings.SECRET_ID:
-            self.require_active = False
+            return secret_id_principal()
+
+        if not self.keyring.get_secrets(public_key):
+            return None
+
+        if self.user_cache is not None:
+            principal = self.user_cache.get(public_key)
+            if principal is not None:
+                return principal
+            if self.user_cache.is_unknown(public_key):
+                return None
+
+        pk = to_pk(public_key)
+        principal = fetch_principals([pk]).get(pk) if pk is not None else None
+        if self.user_cache is not None:
+            if principal is None:
+                self.user_cache.set_unknown(public_key)
+            else:
+                self.user_cache.set(public_key, principal)
+        return principal
+
+    def get_users(self, public_keys):
+        """get_user for many public keys at once, with a single query for the principals not cached
+
+        Returns a dict from each public key to what get_user returns for it.
+        """
+        users = {}
+        missing = {}
+        for public_key in set(public_keys):
+            if public_key == settings.SECRET_ID:
+                users[public_key] = secret_id_principal()
+                continue
+
+            users[public_key] = None
+            if not self.keyring.get_secrets(public_key):
+                continue
+
+            if self.user_cache is not None:
+                principal = self.user_cache.get(public_key)
+                if principal is not None:
+                    users[public_key] = principal
+                    continue
+                if self.user_cache.is_unknown(public_key):
+                    continue
+
+            pk = to_pk(public_key)
+            if pk is not None:
+                missing.setdefault(pk, []).append(public_key)
+
+        if missing:
+            principals = fetch_principals(missing)
+            for pk, keys in missing.items():
+                principal = principals.get(pk)
+                for public_key in keys:
+                    users[public_key] = principal
+                    if self.user_cache is None:
+                        continue
+                    if principal is None:
+                        self.user_cache.set_unknown(public_key)
+                    else:
+                        self.user_cache.set(public_key, principal)
+        return users
+
+    def is_nonce_valid(self, api_key, timestamp):
+        """Rejects a request whose api_key was already accepted, i.e. a replay
+
+        Must run last, so only requests that passed every other check are remembered.
+        """
+        if self.nonce_store is None:
             return True
+        if not self.nonce_store.add(api_key, self.timestamp_expiry(timestamp)):
+            raise ImmediateHttpResponse(response=HttpBadRequest('api_key was already used'))
+        return True
 
-        User = get_user_model()
-        try:
-            user = User.objects.get(pk=public_key)
-        except (User.DoesNotExist, User.MultipleObjectsReturned):
-            return self._unauthorized()
-        return user
+    def timestamp_expiry(self, timestamp):
+        """Returns the epoch from which a request signed at ``timestamp`` fails is_timestamp_valid"""
+        return parse_timestamp(timestamp) + self.timestamp_window * 60 + 1
 
     def is_timestamp_valid(self, timestamp):
-        """Timestamp must be string in %Y-%m-%dT%H:%M:%S. format """
+        """Timestamp must be a string in %Y-%m-%dT%H:%M:%S format, in UTC, or epoch seconds or milliseconds"""
 
         try:
-            timestamp_server = datetime.utcnow()
-            timestamp_client = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S")
-
-            d1_ts = time.mktime(timestamp_client.timetuple())
-            d2_ts = time.mktime(timestamp_server.timetuple())
-
-            diff = int(d2_ts-d1_ts) / 60
+            skew = int(time.time()) - parse_timestamp(timestamp)
+        except ValueError:
+            raise ImmediateHttpResponse(response=HttpBadRequest('Invalid timestamp'))
 
-            if diff > self.timestamp_window:
-                raise ImmediateHttpResponse(response=HttpBadRequest('Exceeded timestamp window'))
-        except Exception, e:
-            raise ImmediateHttpResponse(response=HttpBadRequest('Unknown error on timestamp validation'))
+        if abs(skew) > self.timestamp_window * 60:
+            raise ImmediateHttpResponse(response=HttpBadRequest('Exceeded timestamp window'))
 
         return True
@@ -0,0 +1,182 @@
+from __future__ import unicode_literals
+from collections import namedtuple
+
+from django.utils.encoding import force_bytes
+from tastypie.exceptions import ImmediateHttpResponse
+
+from . import metrics
+from .authentication import HMACAuthentication, HEADER_MODE
+from .canonical import BODY_METHODS, canonical_url, parse_query, unquote_to_bytes
+from .compat import compare_digest, string_types
+from .digests import DIGEST_SIGNING_PREFIX, body_digest
+from .signing import DEFAULT_ALGORITHM, keyed_digest
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # Python 2
+    from urlparse import urlsplit
+
+BatchItem = namedtuple('BatchItem', 'method url body public_key api_key timestamp algorithm content_sha256')
+BatchItem.__new__.__defaults__ = (None, None)
+
+# reason is one of the failure reasons in metrics, None when the request is valid
+BatchResult = namedtuple('BatchResult', 'valid reason')
+
+
+def compute_signatures(job):
+    """Returns the hex signatures of a (secrets, canonical_url, body, algorithm) job, one per secret
+
+    Module level so a process pool can pickle it.
+    """
+    secrets, url, body, algorithm = job
+    signatures = []
+    for secret in secrets:
+        digest_maker = keyed_digest(secret, algorithm)
+        digest_maker.update(url)
+        digest_maker.update(body)
+        signatures.append(digest_maker.hexdigest())
+    return signatures
+
+
+class BatchVerifier(object):
+    """Verifies many signed requests at once, e.g. for a gateway in front of the API
+
+    Takes (method, url, body, public_key, api_key, timestamp[, algorithm[, content_sha256]])
+    items, ``url`` being the full URL the client signed, and runs the checks of ``authentication`` on all of them: secrets
+    come from its keyring, users from a single ``pk__in`` query (see get_users), and
+    nonces are only spent by requests that pass everything else. With the authentication's
+    ``body_digest``, an item's ``content_sha256`` is signed in place of its body, as the
+    Content-SHA256 header would be.
+
+    With a ``pool``, anything with a ``map`` such as multiprocessing.Pool, bodies larger
+    than ``pool_threshold`` bytes are hashed in the pool.
+    """
+
+    def __init__(self, authentication=None, pool=None, pool_threshold=256 * 1024):
+        self.authentication = authentication if authentication is not None else HMACAuthentication()
+        self.pool = pool
+        self.pool_threshold = pool_threshold
+
+    def algorithm(self, item):
+        """The algorithm ``item`` names, in its URL or, in header mode, in its own field, None if none"""
+        if self.authentication.mode == HEADER_MODE:
+            return item.algorithm
+        for key, value in parse_query(urlsplit(item.url).query):
+            if key == 'algorithm':
+                return value
+        return None
+
+    def canonical_url(self, item):
+        scheme, host, path, query_string, _ = urlsplit(item.url)
+        extra = ()
+        if self.authentication.mode == HEADER_MODE:
+            extra = (('public_key', item.public_key), ('timestamp', item.timestamp))
+            if item.algorithm is not None:
+                extra += (('algorithm', item.algorithm),)
+        return canonical_url(scheme, host or 'localhost', unquote_to_bytes(force_bytes(path)), query_string, extra)
+
+    def malformed(self, item):
+        """Returns the reason an item with missing or mistyped fields fails, None if they are fine"""
+        credentials = (item.method, item.url, item.public_key, item.api_key, item.timestamp)
+        if not all(credentials):
+            return metrics.MISSING_CREDENTIAL
+        if not isinstance(item.timestamp, string_types):
+            return metrics.STALE_TIMESTAMP
+        if not all(isinstance(field, string_types) for field in credentials):
+            return metrics.MISSING_CREDENTIAL
+        if not all(field is None or isinstance(field, string_types)
+                   for field in (item.body, item.algorithm, item.content_sha256)):
+            return metrics.BAD_SIGNATURE
+        return None
+
+    def unsigned_credentials(self, item):
+        """In query mode, the reason item fails if its URL doesn't sign its public_key and timestamp
+
+        The signature covers the query parameters, not the item's fields, which are only
+        trusted once they match. Header mode signs the fields themselves.
+        """
+        if self.authentication.mode == HEADER_MODE:
+            return None
+        query = parse_query(urlsplit(item.url).query)
+        for field in ('public_key', 'timestamp'):
+            values = [value for key, value in query if key == field]
+            if not values:
+                return metrics.MISSING_CREDENTIAL
+            if any(value != getattr(item, field) for value in values):
+                return metrics.BAD_SIGNATURE
+        return None
+
+    def signed_digest(self, item):
+        """The content_sha256 item's signature covers instead of its body, None if there is none"""
+        if not self.authentication.body_digest or item.method.upper() not in BODY_METHODS:
+            return None
+        if not item.content_sha256:
+            return None
+        return force_bytes(item.content_sha256.strip().lower())
+
+    def signed_body(self, item):
+        if item.method.upper() not in BODY_METHODS or not item.body:
+            return b''
+        return force_bytes(item.body)
+
+    def verify(self, items):
+        """Returns a BatchResult per item, in the same order"""
+        auth = self.authentication
+        items = [BatchItem(*item) for item in items]
+        reasons = [None] * len(items)
+
+        local_jobs, pooled_jobs = [], []
+        for index, item in enumerate(items):
+            reasons[index] = self.malformed(item) or self.unsigned_credentials(item)
+            if reasons[index] is not None:
+                continue
+            try:
+                auth.is_timestamp_valid(item.timestamp)
+            except ImmediateHttpResponse:
+                reasons[index] = metrics.STALE_TIMESTAMP
+                continue
+            algorithm = self.algorithm(item) or DEFAULT_ALGORITHM
+            secrets = auth.keyring.get_secrets(item.public_key)
+            if not secrets or algorithm not in auth.algorithms:
+                reasons[index] = metrics.BAD_SIGNATURE
+                continue
+            url, body = self.canonical_url(item), self.signed_body(item)
+            digest = self.signed_digest(item)
+            if digest is not None:
+                if not compare_digest(force_bytes(body_digest(body)), digest):
+                    reasons[index] = metrics.BAD_SIGNATURE
+                    continue
+                url, body = DIGEST_SIGNING_PREFIX + url, digest
+            jobs = pooled_jobs if self.pool is not None and len(body) > self.pool_threshold else local_jobs
+            jobs.append((index, (tuple(secrets), url, body, algorithm)))
+
+        signatures = [(index, compute_signatures(job)) for index, job in local_jobs]
+        if pooled_jobs:
+            signatures.extend(zip([index for index, _ in pooled_jobs],
+                                  self.pool.map(compute_signatures, [job for _, job in pooled_jobs])))
+        for index, candidates in signatures:
+            api_key = force_bytes(items[index].api_key)
+            if not any([compare_digest(force_bytes(candidate), api_key) for candidate in candidates]):
+                reasons[index] = metrics.BAD_SIGNATURE
+
+        users = auth.get_users([item.public_key for item, reason in zip(items, reasons) if reason is None])
+
+        results = []
+        for item, reason in zip(items, reasons):
+            if reason is None:
+                reason = self.check(item, users[item.public_key])
+            results.append(BatchResult(auth.record_result(reason), reason))
+        return results
+
+    def check(self, item, principal):
+        """Runs the checks that follow the user lookup, returns the reason item fails or None"""
+        auth = self.authentication
+        if principal is None:
+            return metrics.UNKNOWN_USER
+        if not auth.check_active(principal):
+            return metrics.INACTIVE_USER
+        try:
+            auth.is_nonce_valid(item.api_key, item.timestamp)
+        except ImmediateHttpResponse:
+            return metrics.REPLAYED
+        return None
@@ -0,0 +1,158 @@
+from __future__ import unicode_literals
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from tastypie.compat import get_user_model
+from .principals import to_pk
+
+_missing = object()
+
+
+class LRUCache(object):
+    """A thread-safe, size bounded mapping whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires_at = self._data.pop(key, (_missing, None))
+            if value is _missing or (expires_at is not None and expires_at <= self.timer()):
+                self.misses += 1
+                return default
+            # re-inserting moves the key to the most recently used end
+            self._data[key] = (value, expires_at)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = self.timer() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+
+class UserCache(object):
+    """Caches public_key -> principal lookups done by HMACAuthentication.get_user
+
+    Principals (see principals.Principal) are kept in an in-process LRU for ``ttl`` seconds and, when ``cache_alias`` is given,
+    in that Django cache backend as well, so that every process of a deployment can share them.
+    Entries are dropped on ``post_save``/``post_delete`` of the user model. Other processes only
+    see those changes once their local entries expire, so ``ttl`` bounds how long a deactivated
+    user may still be accepted.
+
+    Public keys that matched no user are remembered too, up to ``negative_maxsize`` of them for
+    ``negative_ttl`` seconds, so floods of unknown keys don't reach the database. Keys that
+    can't even be a primary key are always rejected. A user created in another process is
+    only known to this one once its negative entry expires.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, cache_alias=None, key_prefix='hmacauth:user:',
+                 negative_maxsize=4096, negative_ttl=300):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.unknown = LRUCache(maxsize=negative_maxsize, ttl=negative_ttl) if negative_maxsize else None
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+        User = get_user_model()
+        post_save.connect(self._user_changed, sender=User)
+        post_delete.connect(self._user_changed, sender=User)
+
+    def _normalize(self, public_key):
+        """'01' and 1 must share an entry, since both resolve to the same primary key"""
+        return to_pk(public_key)
+
+    def _shared_key(self, key):
+        return self.key_prefix + key
+
+    def get(self, public_key):
+        key = self._normalize(public_key)
+        if key is None:
+            return None
+
+        principal = self.local.get(key)
+        if principal is not None or self.cache_alias is None:
+            return principal
+
+        principal = caches[self.cache_alias].get(self._shared_key(key))
+        if principal is None:
+            self.shared_misses += 1
+            return None
+        self.shared_hits += 1
+        self.local.set(key, principal)
+        return principal
+
+    def set(self, public_key, principal):
+        key = self._normalize(public_key)
+        if key is None:
+            return
+        self.local.set(key, principal)
+        if self.cache_alias is not None:
+            caches[self.cache_alias].set(self._shared_key(key), principal, self.ttl)
+
+    def is_unknown(self, public_key):
+        """Whether ``public_key`` recently matched no user, or can't be a primary key at all"""
+        key = self._normalize(public_key)
+        if key is None:
+            return True
+        return self.unknown is not None and self.unknown.get(key) is not None
+
+    def set_unknown(self, public_key):
+        key = self._normalize(public_key)
+        if key is not None and self.unknown is not None:
+            self.unknown.set(key, True)
+
+    def invalidate(self, public_key):
+        key = self._normalize(public_key)
+        if key is None:
+            return
+        self.local.delete(key)
+        if self.unknown is not None:
+            self.unknown.delete(key)
+        if self.cache_alias is not None:
+            caches[self.cache_alias].delete(self._shared_key(key))
+
+    def clear(self):
+        self.local.clear()
+        if self.unknown is not None:
+            self.unknown.clear()
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update(shared_hits=self.shared_hits, shared_misses=self.shared_misses)
+        if self.unknown is not None:
+            stats.update(unknown_hits=self.unknown.hits, unknown_size=len(self.unknown))
+        return stats
+
+    def _user_changed(self, sender, instance, **kwargs):
+        self.invalidate(instance.pk)
@@ -0,0 +1,72 @@
+"""Builds the canonical form of a request, i.e. the bytes its signature covers
+
+Server and clients share this module, so both sides canonicalize the same way::
+
+    <scheme>://<host><path>?<key>=<value>&<key>=<value>...
+
+Query parameters are percent-decoded, sorted by key and joined back without ``api_key``.
+Repeated keys are all kept, in the order they were sent. The body of POST, PUT and PATCH
+requests is appended as is.
+"""
+from __future__ import unicode_literals
+import operator
+
+from django.core.handlers.wsgi import get_bytes_from_wsgi
+from django.utils.encoding import force_bytes
+
+try:
+    from urllib.parse import unquote_to_bytes
+except ImportError:  # Python 2
+    from urllib import unquote as unquote_to_bytes
+
+EXCLUDED_PARAMS = ('api_key',)
+
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def _decode(value):
+    if b'%' in value or b'+' in value:
+        value = unquote_to_bytes(value.replace(b'+', b' '))
+    return value.decode('utf-8', 'replace')
+
+
+def parse_query(query_string):
+    """Splits a raw query string into decoded (key, value) pairs the way QueryDict does"""
+    pairs = []
+    for field in force_bytes(query_string).replace(b';', b'&').split(b'&'):
+        if not field:
+            continue
+        key, _, value = field.partition(b'=')
+        pairs.append((_decode(key), _decode(value)))
+    return pairs
+
+
+def canonical_query(query_string, extra=(), excluded=EXCLUDED_PARAMS):
+    """Returns the canonical query, with its leading '?', as bytes; empty if there are no params
+
+    ``extra`` (key, value) pairs are signed as if they were part of the query string.
+    """
+    pairs = [pair for pair in parse_query(query_string) if pair[0] not in excluded]
+    pairs.extend(extra)
+    pairs.sort(key=operator.itemgetter(0))
+    if not pairs:
+        return b''
+    return force_bytes('?' + '&'.join([key + '=' + value for key, value in pairs]))
+
+
+def canonical_url(scheme, host, path, query_string, extra=()):
+    """Returns the canonical URL as bytes. ``path`` must not be percent-encoded"""
+    return force_bytes(scheme) + b'://' + force_bytes(host) + force_bytes(path) + canonical_query(query_string, extra)
+
+
+def request_scheme(request):
+    if 'https' in request.scheme or 'https' in request.META.get('HTTP_X_FORWARDED_PROTO', ''):
+        return 'https'
+    return 'http'
+
+
+def request_canonical_url(request, extra=()):
+    """Returns the canonical URL of a Django request"""
+    host = request.META.get('HTTP_HOST', 'localhost')  # ResourceTestCase api_client does not set HTTP_HOST
+    return canonical_url(request_scheme(request), host, get_bytes_from_wsgi(request.META, 'PATH_INFO', ''),
+                         get_bytes_from_wsgi(request.META, 'QUERY_STRING', ''), extra)
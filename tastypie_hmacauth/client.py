@@ -0,0 +1,172 @@
+"""Signs requests for an API protected by HMACAuthentication
+
+Signer works with any HTTP library. HMACClient wraps a requests.Session, so it needs
+``requests`` (``pip install django-tastypie-hmacauth[client]``)::
+
+    client = HMACClient('https://api.example.com', public_key='1', secret=secret)
+    client.get('/api/v1/funcionario/', params={'limit': 20})
+    client.post('/api/v1/patrao/', json={'usuario': '/api/v1/usuario/1/'})
+"""
+from __future__ import unicode_literals
+import json as json_module
+import time
+
+from django.utils.encoding import force_bytes
+
+from .canonical import BODY_METHODS, canonical_url, unquote_to_bytes
+from .config import QUERY_MODE, HEADER_MODE
+from .digests import BODY_DIGEST_HEADER, DIGEST_SIGNING_PREFIX, body_digest
+from .signing import DEFAULT_ALGORITHM, available_algorithms, keyed_digest
+
+try:
+    from urllib.parse import urlencode, urlsplit
+except ImportError:  # Python 2
+    from urllib import urlencode
+    from urlparse import urlsplit
+
+
+def _append_query(url, query):
+    if not query:
+        return url
+    return url + ('&' if '?' in url else '?') + query
+
+
+class Signer(object):
+    """Signs requests as ``public_key``, canonicalizing them exactly like the server does
+
+    The secret is keyed once, see signing.keyed_digest, and file-like bodies are hashed in
+    chunks of ``chunk_size`` bytes and rewound, so they can still be streamed to the server.
+    With ``body_digest`` the body's SHA-256 is sent as Content-SHA256 and signed instead of
+    the body, for servers configured with body_digest=True. Requests are signed with
+    ``algorithm``, one of signing.ALGORITHMS, which is sent along unless it is the default.
+    """
+
+    def __init__(self, public_key, secret, mode=QUERY_MODE, chunk_size=64 * 1024, body_digest=False,
+                 algorithm=DEFAULT_ALGORITHM):
+        if mode not in (QUERY_MODE, HEADER_MODE):
+            raise ValueError('mode must be %r or %r' % (QUERY_MODE, HEADER_MODE))
+        if algorithm not in available_algorithms():
+            raise ValueError('algorithm must be one of %s' % (available_algorithms(),))
+        self.public_key = '%s' % public_key
+        self.secret = secret
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.body_digest = body_digest
+        self.algorithm = algorithm
+
+    def timestamp(self):
+        return '%d' % time.time()
+
+    def sign(self, method, url, body=None, timestamp=None):
+        """Returns the URL to request and the headers to send with it
+
+        ``body`` is what will be sent as is: bytes, text or a file-like object.
+        """
+        timestamp = timestamp or self.timestamp()
+        credentials = [('public_key', self.public_key), ('timestamp', timestamp)]
+        if self.algorithm != DEFAULT_ALGORITHM:
+            credentials.append(('algorithm', self.algorithm))
+        extra = ()
+        if self.mode == QUERY_MODE:
+            url = _append_query(url, urlencode(credentials))
+        else:
+            extra = tuple(credentials)
+
+        scheme, host, path, query_string, _ = urlsplit(url)
+        digest_maker = keyed_digest(self.secret, self.algorithm)
+        headers = {}
+        has_body = method.upper() in BODY_METHODS and body is not None
+        if has_body and self.body_digest:
+            headers[BODY_DIGEST_HEADER] = body_digest(body, self.chunk_size)
+            digest_maker.update(DIGEST_SIGNING_PREFIX)
+        digest_maker.update(canonical_url(scheme, host, unquote_to_bytes(force_bytes(path)), query_string, extra))
+        if has_body and self.body_digest:
+            digest_maker.update(force_bytes(headers[BODY_DIGEST_HEADER]))
+        elif has_body:
+            self.hash_body(digest_maker, body)
+        api_key = digest_maker.hexdigest()
+
+        if self.mode == QUERY_MODE:
+            return _append_query(url, 'api_key=' + api_key), headers
+        headers['Authorization'] = 'HMAC %s:%s:%s' % (self.public_key, api_key, timestamp)
+        if self.algorithm != DEFAULT_ALGORITHM:
+            headers['Authorization'] += ' algorithm=' + self.algorithm
+        return url, headers
+
+    def hash_body(self, digest_maker, body):
+        if not hasattr(body, 'read'):
+            digest_maker.update(force_bytes(body))
+            return
+
+        start = body.tell()
+        chunk = body.read(self.chunk_size)
+        while chunk:
+            digest_maker.update(force_bytes(chunk))
+            chunk = body.read(self.chunk_size)
+        body.seek(start)
+
+
+class HMACClient(object):
+    """A keep-alive, pooled HTTP client that signs every request it sends
+
+    Connections to ``base_url`` are reused through a requests.Session whose adapter keeps up
+    to ``pool_maxsize`` of them open, so the client can be shared by that many threads.
+    """
+
+    def __init__(self, base_url, public_key, secret, mode=QUERY_MODE, pool_connections=10, pool_maxsize=10,
+                 session=None, chunk_size=64 * 1024, body_digest=False, algorithm=DEFAULT_ALGORITHM):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip('/')
+        self.signer = Signer(public_key, secret, mode=mode, chunk_size=chunk_size, body_digest=body_digest,
+                             algorithm=algorithm)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def prepare(self, method, path, params=None, data=None, json=None, headers=None):
+        """Returns the (url, headers, body) to send, e.g. to sign requests ahead of time"""
+        url = self.base_url + path
+        if params:
+            url = _append_query(url, urlencode(params, doseq=True))
+
+        headers = dict(headers or {})
+        if json is not None:
+            data = json_module.dumps(json)
+            headers.setdefault('Content-Type', 'application/json')
+        elif isinstance(data, dict):
+            data = urlencode(data, doseq=True)
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+
+        if data is not None and not hasattr(data, 'read'):
+            data = force_bytes(data)
+
+        url, auth_headers = self.signer.sign(method, url, data)
+        headers.update(auth_headers)
+        return url, headers, data
+
+    def request(self, method, path, params=None, data=None, json=None, headers=None, **kwargs):
+        url, headers, data = self.prepare(method, path, params, data, json, headers)
+        return self.session.request(method, url, data=data, headers=headers, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
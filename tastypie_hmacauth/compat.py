@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # Django 4.0+
+    from django.utils.encoding import force_str as force_text
+
+try:
+    from django.utils.encoding import python_2_unicode_compatible
+except ImportError:  # Django 3.0+, Python 3 only
+    def python_2_unicode_compatible(klass):
+        return klass
+
+try:
+    string_types = (basestring,)
+except NameError:  # Python 3
+    string_types = (str,)
+
+try:
+    from hmac import compare_digest
+except ImportError:  # Python < 2.7.7
+    from django.utils.crypto import constant_time_compare as compare_digest
+
+try:
+    from hashlib import blake2b
+except ImportError:  # Python < 3.6
+    try:
+        from pyblake2 import blake2b
+    except ImportError:
+        blake2b = None
@@ -0,0 +1,73 @@
+from __future__ import unicode_literals
+
+from . import metrics
+from .keyring import default_keyring
+from .signing import ALGORITHMS, available_algorithms
+
+QUERY_MODE = 'query'
+HEADER_MODE = 'header'
+
+# cheapest first, so garbage is rejected before any hashing; the replay check spends the
+# nonce, so it always comes last
+DEFAULT_STAGES = (metrics.TIMESTAMP, metrics.SIGNATURE, metrics.USER_LOOKUP, metrics.REPLAY)
+
+
+class HMACAuthConfig(object):
+    """The options of an HMACAuthentication, immutable so resources and threads can share them
+
+    The caches, keyring, nonce store and instrumentation it points to are shared along with
+    it, and are all thread-safe. Use ``replace()`` to derive a config with other options.
+    """
+    __slots__ = ('require_active', 'timestamp_window', 'user_cache', 'body_chunk_size', 'keyring',
+                 'nonce_store', 'mode', 'verification_cache', 'instrumentation', 'body_digest',
+                 'defer_body_digest', 'stages', 'algorithms', 'tokens')
+
+    def __init__(self, require_active=True, timestamp_window=5, user_cache=None, body_chunk_size=64 * 1024,
+                 keyring=None, nonce_store=None, mode=QUERY_MODE, verification_cache=None,
+                 instrumentation=None, body_digest=False, defer_body_digest=True, stages=DEFAULT_STAGES,
+                 algorithms=None, tokens=None):
+        if mode not in (QUERY_MODE, HEADER_MODE):
+            raise ValueError('mode must be %r or %r' % (QUERY_MODE, HEADER_MODE))
+        stages = tuple(stages)
+        if sorted(stages) != sorted(DEFAULT_STAGES) or stages[-1] != metrics.REPLAY:
+            raise ValueError('stages must be an ordering of %s, with %r last' % (DEFAULT_STAGES, metrics.REPLAY))
+        store_window = getattr(nonce_store, 'timestamp_window', timestamp_window)
+        if store_window < timestamp_window:
+            raise ValueError('nonce_store covers a timestamp window of %s minutes, narrower than timestamp_window=%s'
+                             % (store_window, timestamp_window))
+        algorithms = available_algorithms() if algorithms is None else tuple(algorithms)
+        for algorithm in algorithms:
+            if algorithm not in available_algorithms():
+                raise ValueError('algorithms must be some of %s, %r is unknown or not available' % (ALGORITHMS, algorithm))
+        init = super(HMACAuthConfig, self).__setattr__
+        init('require_active', require_active)
+        init('timestamp_window', timestamp_window)
+        init('user_cache', user_cache)
+        init('body_chunk_size', body_chunk_size)
+        init('keyring', keyring if keyring is not None else default_keyring)
+        init('nonce_store', nonce_store)
+        init('mode', mode)
+        init('verification_cache', verification_cache)
+        init('instrumentation', instrumentation)
+        init('body_digest', body_digest)
+        init('defer_body_digest', defer_body_digest)
+        init('stages', stages)
+        init('algorithms', algorithms)
+        init('tokens', tokens)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('HMACAuthConfig is immutable, use replace()')
+
+    def __delattr__(self, name):
+        raise AttributeError('HMACAuthConfig is immutable, use replace()')
+
+    def options(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def replace(self, **changes):
+        options = self.options()
+        options.update(changes)
+        return HMACAuthConfig(**options)
+
+    def __repr__(self):
+        return 'HMACAuthConfig(%s)' % ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
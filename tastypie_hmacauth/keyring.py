@@ -0,0 +1,87 @@
+from __future__ import unicode_literals
+import threading
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from .compat import force_text
+
+
+class Keyring(object):
+    """Tells which secrets a client may sign its requests with"""
+
+    def get_secrets(self, public_key):
+        """Returns a sequence with the secrets of ``public_key``, empty if it has none"""
+        raise NotImplementedError()
+
+    def is_loaded(self):
+        """Whether get_secrets can answer without any I/O"""
+        return True
+
+
+class SettingsKeyring(Keyring):
+    """Every client signs with settings.SECRET_KEY"""
+
+    def get_secrets(self, public_key):
+        return (settings.SECRET_KEY,)
+
+
+class ModelKeyring(Keyring):
+    """Per client secrets, stored as ClientSecret rows and looked up in memory
+
+    All active secrets are loaded into a dict on first use. Afterwards the entry of a
+    single client is reloaded whenever one of its secrets is saved or deleted, so
+    requests never query the database for secrets. The SECRET_ID principal keeps
+    signing with settings.SECRET_KEY.
+
+    Needs ``tastypie_hmacauth`` in INSTALLED_APPS.
+    """
+
+    def __init__(self):
+        from .models import ClientSecret
+
+        self._index = None
+        self._lock = threading.Lock()
+        post_save.connect(self._secret_changed, sender=ClientSecret)
+        post_delete.connect(self._secret_changed, sender=ClientSecret)
+
+    def _active_secrets(self):
+        from .models import ClientSecret
+        return ClientSecret.objects.filter(is_active=True)
+
+    def load(self):
+        index = {}
+        for user_id, secret in self._active_secrets().values_list('user_id', 'secret').iterator():
+            index.setdefault(force_text(user_id), []).append(secret)
+        index = dict((public_key, tuple(secrets)) for public_key, secrets in index.items())
+        with self._lock:
+            self._index = index
+        return index
+
+    def is_loaded(self):
+        return self._index is not None
+
+    def get_secrets(self, public_key):
+        if public_key == settings.SECRET_ID:
+            return (settings.SECRET_KEY,)
+
+        index = self._index
+        if index is None:
+            index = self.load()
+        return index.get(public_key, ())
+
+    def refresh(self, public_key):
+        public_key = force_text(public_key)
+        secrets = tuple(self._active_secrets().filter(user_id=public_key).values_list('secret', flat=True))
+        with self._lock:
+            if self._index is None:
+                return
+            if secrets:
+                self._index[public_key] = secrets
+            else:
+                self._index.pop(public_key, None)
+
+    def _secret_changed(self, sender, instance, **kwargs):
+        self.refresh(instance.user_id)
+
+
+default_keyring = SettingsKeyring()
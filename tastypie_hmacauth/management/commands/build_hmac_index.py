@@ -0,0 +1,20 @@
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tastypie_hmacauth.sharedindex import build_index
+
+
+class Command(BaseCommand):
+    help = 'Writes the shared principal and secret index read by sharedindex.SharedIndex'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='defaults to settings.HMACAUTH_INDEX_PATH')
+
+    def handle(self, *args, **options):
+        path = options.get('path') or getattr(settings, 'HMACAUTH_INDEX_PATH', None)
+        if not path:
+            raise CommandError('Give the path of the index or set HMACAUTH_INDEX_PATH')
+        records = build_index(path)
+        self.stdout.write('Wrote %d records to %s' % (records, path))
@@ -0,0 +1,133 @@
+from __future__ import unicode_literals
+import threading
+from collections import defaultdict
+
+# stages of HMACAuthentication.is_authenticated
+EXTRACT = 'extract'
+SIGNATURE = 'signature'
+USER_LOOKUP = 'user_lookup'
+TIMESTAMP = 'timestamp'
+REPLAY = 'replay'
+TOKEN = 'token'
+
+# reasons a request fails authentication
+MISSING_CREDENTIAL = 'missing_credential'
+BAD_SIGNATURE = 'bad_signature'
+UNKNOWN_USER = 'unknown_user'
+INACTIVE_USER = 'inactive_user'
+STALE_TIMESTAMP = 'stale_timestamp'
+REPLAYED = 'replayed'
+INVALID_TOKEN = 'invalid_token'
+# an unexpected exception, e.g. the database being down, rather than a fault of the client
+ERROR = 'error'
+
+# the reason a request fails at each stage; at USER_LOOKUP, an inactive user is INACTIVE_USER
+STAGE_REASONS = {
+    EXTRACT: MISSING_CREDENTIAL,
+    SIGNATURE: BAD_SIGNATURE,
+    USER_LOOKUP: UNKNOWN_USER,
+    TIMESTAMP: STALE_TIMESTAMP,
+    REPLAY: REPLAYED,
+    TOKEN: INVALID_TOKEN,
+}
+
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Instrumentation(object):
+    """Receives what happens inside HMACAuthentication.is_authenticated
+
+    Subclass it to feed your own monitoring. HMACAuthentication doesn't even read the
+    clock when it has no instrumentation.
+    """
+
+    def observe(self, stage, seconds):
+        """Called with the time a stage took, whether it passed or not"""
+
+    def succeeded(self):
+        pass
+
+    def failed(self, reason):
+        pass
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+def _format_float(value):
+    return repr(float(value))
+
+
+class PrometheusMetrics(Instrumentation):
+    """Counts successes and failures by reason and keeps a latency histogram per stage
+
+    ``render()`` returns them in the Prometheus text format, see views.metrics.
+    """
+
+    def __init__(self, namespace='hmacauth', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self.successes = 0
+        self.failures = defaultdict(int)
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def succeeded(self):
+        with self._lock:
+            self.successes += 1
+
+    def failed(self, reason):
+        with self._lock:
+            self.failures[reason] += 1
+
+    def render(self):
+        name = self.namespace
+        lines = [
+            '# HELP %s_success_total Requests that passed authentication.' % name,
+            '# TYPE %s_success_total counter' % name,
+            '%s_success_total %d' % (name, self.successes),
+            '# HELP %s_failure_total Requests that failed authentication, by reason.' % name,
+            '# TYPE %s_failure_total counter' % name,
+        ]
+        with self._lock:
+            for reason, count in sorted(self.failures.items()):
+                lines.append('%s_failure_total{reason="%s"} %d' % (name, reason, count))
+
+            lines.append('# HELP %s_stage_seconds Time spent in each authentication stage.' % name)
+            lines.append('# TYPE %s_stage_seconds histogram' % name)
+            for stage, histogram in sorted(self.stages.items()):
+                for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append('%s_stage_seconds_bucket{stage="%s",le="%s"} %d' % (
+                        name, stage, _format_float(bound), count))
+                lines.append('%s_stage_seconds_bucket{stage="%s",le="+Inf"} %d' % (name, stage, histogram.count))
+                lines.append('%s_stage_seconds_sum{stage="%s"} %s' % (name, stage, _format_float(histogram.sum)))
+                lines.append('%s_stage_seconds_count{stage="%s"} %d' % (name, stage, histogram.count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,29 @@
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+from .authentication import HMACAuthentication
+
+
+class HMACAuthenticationMiddleware(object):
+    """Verifies HMAC signed requests once, before any resource sees them
+
+    The verified principal is left on the request, so every HMACAuthentication the
+    request then goes through accepts it without canonicalizing, hashing or looking
+    the user up again. Requests that fail are let through untouched, the resources
+    reject them as usual.
+
+    Works both in MIDDLEWARE_CLASSES and in MIDDLEWARE. The authenticator is built with
+    the keyword arguments in settings.HMACAUTH_MIDDLEWARE_OPTIONS.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+        self.authentication = HMACAuthentication(**getattr(settings, 'HMACAUTH_MIDDLEWARE_OPTIONS', {}))
+
+    def __call__(self, request):
+        self.process_request(request)
+        return self.get_response(request)
+
+    def process_request(self, request):
+        self.authentication.is_authenticated(request)
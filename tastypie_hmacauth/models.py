@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import models
+from django.utils.crypto import get_random_string
+
+from .compat import python_2_unicode_compatible
+
+
+def generate_secret():
+    return get_random_string(50)
+
+
+@python_2_unicode_compatible
+class ClientSecret(models.Model):
+    """A secret a client signs its requests with
+
+    A user may hold several active secrets at once, so a new one can be issued
+    before the old one is revoked.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='hmac_secrets', on_delete=models.CASCADE)
+    secret = models.CharField(max_length=128, default=generate_secret)
+    is_active = models.BooleanField(default=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return '%s (%s)' % (self.user_id, 'active' if self.is_active else 'revoked')
@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+import math
+import threading
+import time
+
+from django.core.cache import caches
+
+
+class NonceStore(object):
+    """Remembers the api_keys already accepted, so a captured request can't be replayed
+
+    Entries only need to live until the request timestamp falls out of the timestamp
+    window, since from then on is_timestamp_valid rejects the request anyway.
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.replayed = 0
+
+    def add(self, api_key, expires_at):
+        """Returns False if ``api_key`` was already seen and is yet to expire"""
+        raise NotImplementedError()
+
+    def _count(self, added):
+        if added:
+            self.accepted += 1
+        else:
+            self.replayed += 1
+        return added
+
+    def stats(self):
+        return {'accepted': self.accepted, 'replayed': self.replayed}
+
+
+class LocalNonceStore(NonceStore):
+    """An in-process nonce store, for single node deployments
+
+    Entries are grouped into buckets of ``resolution`` seconds by expiry time, and the
+    buckets form a ring just long enough to cover the timestamp window. A bucket is
+    emptied when the ring wraps around to it, so memory is bounded by the request rate
+    times the window and both insertion and lookup touch a single set.
+
+    ``timestamp_window`` must be at least that of the authentication using the store, or
+    entries of valid requests would outlive the ring and be refused as replays;
+    HMACAuthConfig checks it.
+    """
+
+    def __init__(self, timestamp_window=5, resolution=1, timer=time.time):
+        super(LocalNonceStore, self).__init__()
+        self.timestamp_window = timestamp_window
+        self.resolution = resolution
+        self.timer = timer
+        # timestamps may also be up to a whole window ahead of the server clock
+        self.horizon = 2 * timestamp_window * 60 + 1
+        size = int(math.ceil(float(self.horizon) / resolution)) + 2
+        self._ring = [[None, set()] for _ in range(size)]
+        self._lock = threading.Lock()
+
+    def add(self, api_key, expires_at):
+        now = self.timer()
+        if expires_at <= now:
+            return self._count(False)
+        if expires_at > now + self.horizon + self.resolution:
+            # would outlive the ring; is_timestamp_valid should never let such a request through
+            return self._count(False)
+
+        slot = int(expires_at // self.resolution)
+        with self._lock:
+            bucket = self._ring[slot % len(self._ring)]
+            if bucket[0] != slot:
+                bucket[0] = slot
+                bucket[1] = set()
+            if api_key in bucket[1]:
+                return self._count(False)
+            bucket[1].add(api_key)
+        return self._count(True)
+
+    def occupancy(self):
+        oldest = int(self.timer() // self.resolution)
+        with self._lock:
+            return sum(len(keys) for slot, keys in self._ring if slot is not None and slot >= oldest)
+
+    def stats(self):
+        stats = super(LocalNonceStore, self).stats()
+        stats.update(occupancy=self.occupancy(), buckets=len(self._ring))
+        return stats
+
+
+class CacheNonceStore(NonceStore):
+    """A nonce store kept in a Django cache backend, for deployments with several nodes
+
+    Relies on the atomic ``cache.add``, so the backend must be shared by every node
+    (memcached, redis, database...), not the default local memory cache.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='hmacauth:nonce:', timer=time.time):
+        super(CacheNonceStore, self).__init__()
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.timer = timer
+
+    def add(self, api_key, expires_at):
+        timeout = int(math.ceil(expires_at - self.timer()))
+        if timeout <= 0:
+            return self._count(False)
+        return self._count(caches[self.cache_alias].add(self.key_prefix + api_key, 1, timeout))
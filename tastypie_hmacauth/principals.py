@@ -0,0 +1,100 @@
+"""What HMACAuthentication knows about whoever signed a request
+
+A Principal holds the primary key of the user, its active flag and its scopes, read with
+a single narrow ``values_list`` query. The User instance is only loaded when something,
+such as an authorization class going through ``request.user``, asks for it.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from tastypie.compat import get_user_model
+
+from .compat import force_text
+
+# user flags that become scopes, named after the flag without its "is_"
+SCOPE_FIELDS = ('is_staff', 'is_superuser')
+
+
+class Principal(object):
+    """An immutable, slotted stand-in for the user behind a public key"""
+
+    __slots__ = ('pk', 'is_active', 'scopes')
+
+    def __init__(self, pk, is_active=True, scopes=()):
+        object.__setattr__(self, 'pk', force_text(pk))
+        object.__setattr__(self, 'is_active', bool(is_active))
+        object.__setattr__(self, 'scopes', tuple(scopes))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Principal is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Principal is immutable')
+
+    def __reduce__(self):
+        return Principal, (self.pk, self.is_active, self.scopes)
+
+    def __eq__(self, other):
+        if not isinstance(other, Principal):
+            return NotImplemented
+        return (self.pk, self.is_active, self.scopes) == (other.pk, other.is_active, other.scopes)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.pk, self.is_active, self.scopes))
+
+    def __repr__(self):
+        return 'Principal(pk=%r, is_active=%r, scopes=%r)' % (self.pk, self.is_active, self.scopes)
+
+    def has_scope(self, scope):
+        return scope in self.scopes
+
+    @property
+    def is_secret_id(self):
+        """Whether the request was signed with settings.SECRET_KEY, which belongs to no user"""
+        return self.pk == force_text(settings.SECRET_ID)
+
+    def load_user(self):
+        """Fetches the full User, None for the SECRET_ID principal"""
+        if self.is_secret_id:
+            return None
+        return get_user_model().objects.get(pk=self.pk)
+
+
+def secret_id_principal():
+    return Principal(settings.SECRET_ID)
+
+
+def to_pk(public_key):
+    """The primary key ``public_key`` stands for, as text, None if it can't be one"""
+    try:
+        return force_text(get_user_model()._meta.pk.to_python(public_key))
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+
+def principal_fields():
+    """The user fields a Principal is read from: pk, is_active, then the SCOPE_FIELDS it has"""
+    names = set(field.name for field in get_user_model()._meta.get_fields())
+    return ('pk', 'is_active') + tuple(name for name in SCOPE_FIELDS if name in names)
+
+
+def principal_from_row(fields, row):
+    """Builds the Principal of a ``values_list(*fields)`` row"""
+    scopes = [name[len('is_'):] for name, flag in zip(fields[2:], row[2:]) if flag]
+    return Principal(row[0], row[1], scopes)
+
+
+def fetch_principals(pks):
+    """Returns a dict from each primary key in ``pks`` that exists to its Principal, in one query"""
+    fields = principal_fields()
+    rows = get_user_model().objects.filter(pk__in=list(pks)).values_list(*fields)
+    principals = {}
+    for row in rows:
+        principal = principal_from_row(fields, row)
+        principals[principal.pk] = principal
+    return principals
@@ -0,0 +1,261 @@
+"""A principal and secret index in a memory-mapped file, shared by every worker of a host
+
+The file is an open-addressing hash table of fixed-width records, one per user and one
+per active secret, keyed by a hash of the public key. Workers map it read-only, so the
+operating system keeps a single copy in its page cache, and look public keys up without
+a query or a cache round trip. ``build_index`` rewrites it atomically, from the
+``build_hmac_index`` management command or from signals (see ``rebuild_on_change``), and
+workers remap it when it is replaced.
+
+    index = SharedIndex('/var/run/myapi/hmac.idx')
+    hmac_config = HMACAuthConfig(user_cache=index, keyring=index)
+"""
+from __future__ import unicode_literals
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_bytes
+from tastypie.compat import get_user_model
+
+from .compat import force_text
+from .keyring import Keyring
+from .principals import SCOPE_FIELDS, Principal, principal_fields, principal_from_row
+
+MAGIC = b'HMACIDX1'
+HEADER = struct.Struct('<8sIII')          # magic, slots, record size, records
+RECORD = struct.Struct('<QB63s128s')      # key hash, flags, public key, secret
+ACTIVE = 1
+# the scope named after SCOPE_FIELDS[i] is stored as bit i + 1 of the flags
+SCOPE_FLAGS = dict((name[len('is_'):], 2 << i) for i, name in enumerate(SCOPE_FIELDS))
+MAX_PUBLIC_KEY = 63
+MAX_SECRET = 128
+
+
+def key_hash(public_key):
+    """A non-zero 64 bit hash of the public key, zero marks empty slots"""
+    value = struct.unpack('<Q', hashlib.sha1(force_bytes(public_key)).digest()[:8])[0]
+    return value or 1
+
+
+def _records():
+    User = get_user_model()
+    from .models import ClientSecret
+
+    fields = principal_fields()
+    for row in User.objects.values_list(*fields).iterator():
+        principal = principal_from_row(fields, row)
+        flags = ACTIVE if principal.is_active else 0
+        for scope in principal.scopes:
+            flags |= SCOPE_FLAGS[scope]
+        yield principal.pk, flags, ''
+    secrets = ClientSecret.objects.filter(is_active=True, user__is_active=True)
+    for user_id, secret in secrets.values_list('user_id', 'secret').iterator():
+        yield force_text(user_id), ACTIVE, secret
+
+
+def build_index(path, load_factor=0.5):
+    """Writes the index of every user and active secret to ``path``, atomically
+
+    Returns the number of records written.
+    """
+    records = list(_records())
+    slots = 1
+    while slots * load_factor < len(records) + 1:
+        slots *= 2
+    mask = slots - 1
+
+    table = bytearray(HEADER.size + slots * RECORD.size)
+    HEADER.pack_into(table, 0, MAGIC, slots, RECORD.size, len(records))
+    for public_key, flags, secret in records:
+        encoded_key, encoded_secret = force_bytes(public_key), force_bytes(secret)
+        if len(encoded_key) > MAX_PUBLIC_KEY or len(encoded_secret) > MAX_SECRET:
+            raise ValueError('public key %r or its secret does not fit in an index record' % public_key)
+        hashed = key_hash(public_key)
+        slot = hashed & mask
+        while RECORD.unpack_from(table, HEADER.size + slot * RECORD.size)[0]:
+            slot = (slot + 1) & mask
+        RECORD.pack_into(table, HEADER.size + slot * RECORD.size, hashed, flags, encoded_key, encoded_secret)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(prefix='.hmacidx', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as index_file:
+            index_file.write(table)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+    except Exception:
+        os.remove(temporary)
+        raise
+    return len(records)
+
+
+class SharedIndex(Keyring):
+    """Looks principals and secrets up in a file written by build_index
+
+    Serves both as the ``keyring`` and as the ``user_cache`` of an HMACAuthConfig. The index
+    holds every user, so with ``authoritative`` a public key missing from it is rejected
+    without querying the database. The file is checked for replacement every ``check_interval`` seconds.
+    """
+
+    def __init__(self, path, check_interval=1, authoritative=True, timer=time.time):
+        self.path = path
+        self.check_interval = check_interval
+        self.authoritative = authoritative
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._map = None
+        self._identity = None
+        self._next_check = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _mapping(self):
+        now = self.timer()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    self._remap()
+        return self._map
+
+    def _remap(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._map, self._identity = None, None
+            return
+        identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+        if identity == self._identity:
+            return
+
+        with open(self.path, 'rb') as index_file:
+            mapping = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slots, record_size, _ = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError('%s is not an HMAC index' % self.path)
+        # readers still holding the previous mapping keep it alive until they are done
+        self._map, self._identity = (mapping, slots - 1), identity
+
+    def lookup(self, public_key):
+        """Returns the (flags, secrets) of ``public_key``, None if it isn't indexed"""
+        mapping = self._mapping()
+        if mapping is None:
+            return None
+        table, mask = mapping
+        public_key = force_text(public_key)
+        encoded_key = force_bytes(public_key)
+        hashed = key_hash(public_key)
+        slot = hashed & mask
+        found, flags, secrets = False, 0, []
+        while True:
+            record_hash, record_flags, record_key, secret = RECORD.unpack_from(table, HEADER.size + slot * RECORD.size)
+            if not record_hash:
+                break
+            if record_hash == hashed and record_key.rstrip(b'\0') == encoded_key:
+                found = True
+                flags |= record_flags
+                secret = secret.rstrip(b'\0')
+                if secret:
+                    secrets.append(secret.decode('utf-8'))
+            slot = (slot + 1) & mask
+        if not found:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return flags, tuple(secrets)
+
+    # Keyring
+
+    def get_secrets(self, public_key):
+        if public_key == settings.SECRET_ID:
+            return (settings.SECRET_KEY,)
+        entry = self.lookup(public_key)
+        return entry[1] if entry is not None else ()
+
+    def is_loaded(self):
+        return self._mapping() is not None
+
+    # UserCache
+
+    def get(self, public_key):
+        entry = self.lookup(public_key)
+        if entry is None:
+            return None
+        flags = entry[0]
+        scopes = [scope for scope, flag in sorted(SCOPE_FLAGS.items(), key=lambda item: item[1]) if flags & flag]
+        return Principal(public_key, flags & ACTIVE, scopes)
+
+    def set(self, public_key, principal):
+        pass
+
+    def is_unknown(self, public_key):
+        return self.authoritative and self.is_loaded() and self.lookup(public_key) is None
+
+    def set_unknown(self, public_key):
+        pass
+
+    def invalidate(self, public_key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        mapping = self._mapping()
+        records = HEADER.unpack_from(mapping[0], 0)[3] if mapping is not None else 0
+        return {'hits': self.hits, 'misses': self.misses, 'records': records}
+
+
+_lock = threading.Lock()
+_rebuilds = {}
+
+
+def rebuild_on_change(path, delay=1.0):
+    """Rebuilds the index at ``path`` shortly after users or secrets change in this process
+
+    Changes arriving within ``delay`` seconds are folded into a single rebuild, which reads
+    every user, so keep this for read-mostly user tables. The rebuild is scheduled once the
+    saving transaction commits. Django 1.8 has no transaction.on_commit, so there it is
+    scheduled on save, and a transaction still open after ``delay`` seconds is missed
+    until the next rebuild: raise ``delay``, or run build_hmac_index from cron as well.
+    """
+    from .models import ClientSecret
+
+    def schedule(sender, using=None, **kwargs):
+        on_commit = getattr(transaction, 'on_commit', None)
+        if on_commit is None:  # Django < 1.9
+            start()
+        else:
+            on_commit(start, using=using)
+
+    def start():
+        with _lock:
+            if _rebuilds.get(path) is not None:
+                return
+            timer = _rebuilds[path] = threading.Timer(delay, rebuild)
+            timer.daemon = True
+            timer.start()
+
+    def rebuild():
+        with _lock:
+            _rebuilds[path] = None
+        try:
+            build_index(path)
+        finally:
+            # each rebuild runs in a thread of its own, which would leak its connection
+            connection.close()
+
+    for model in (get_user_model(), ClientSecret):
+        post_save.connect(schedule, sender=model, weak=False, dispatch_uid=('hmacauth-index', path, model))
+        post_delete.connect(schedule, sender=model, weak=False, dispatch_uid=('hmacauth-index', path, model))
+
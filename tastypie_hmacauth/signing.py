@@ -0,0 +1,72 @@
+"""Keyed digests requests are signed with
+
+Clients name the algorithm they signed with in the ``algorithm`` credential. Requests
+that don't name one are signed with DEFAULT_ALGORITHM, like before the field existed.
+"""
+from __future__ import unicode_literals
+import hashlib
+import hmac
+
+from django.utils.encoding import force_bytes
+
+from .compat import blake2b
+
+HMAC_SHA256 = 'hmac-sha256'
+HMAC_SHA512 = 'hmac-sha512'
+BLAKE2B_256 = 'blake2b-256'
+
+ALGORITHMS = (HMAC_SHA256, HMAC_SHA512, BLAKE2B_256)
+DEFAULT_ALGORITHM = HMAC_SHA256
+
+# Secrets only ever come from the server side (settings or the keyring), so this stays small.
+# The bound just keeps rotated secrets from piling up in long running processes.
+MAX_KEYED_STATES = 1024
+
+_keyed_states = {}
+
+
+def available_algorithms():
+    """The ALGORITHMS this interpreter supports, BLAKE2b needs Python 3.6 or pyblake2"""
+    return tuple(algorithm for algorithm in ALGORITHMS if algorithm != BLAKE2B_256 or blake2b is not None)
+
+
+def _keyed_state(cache_key, factory):
+    state = _keyed_states.get(cache_key)
+    if state is None:
+        if len(_keyed_states) >= MAX_KEYED_STATES:
+            _keyed_states.clear()
+        state = _keyed_states[cache_key] = factory()
+    return state.copy()
+
+
+def keyed_hmac(secret, digestmod=hashlib.sha256):
+    """Returns a new HMAC object for ``secret``
+
+    Keying an HMAC pads the secret and hashes the inner and outer key blocks. That work is
+    done once per secret and every call gets a ``copy()`` of the already keyed state instead.
+    """
+    return _keyed_state((secret, digestmod), lambda: hmac.new(force_bytes(secret), digestmod=digestmod))
+
+
+def keyed_blake2b(secret):
+    """Returns a new keyed BLAKE2b object with a 32 byte digest for ``secret``
+
+    BLAKE2b takes keys of up to 64 bytes, longer secrets are hashed down to 64 bytes first.
+    """
+    def factory():
+        key = force_bytes(secret)
+        if len(key) > 64:
+            key = blake2b(key).digest()
+        return blake2b(key=key, digest_size=32)
+    return _keyed_state((secret, BLAKE2B_256), factory)
+
+
+def keyed_digest(secret, algorithm=DEFAULT_ALGORITHM):
+    """Returns a new digest maker of ``algorithm`` keyed with ``secret``"""
+    if algorithm == HMAC_SHA256:
+        return keyed_hmac(secret)
+    if algorithm == HMAC_SHA512:
+        return keyed_hmac(secret, hashlib.sha512)
+    if algorithm == BLAKE2B_256 and blake2b is not None:
+        return keyed_blake2b(secret)
+    raise ValueError('Unsupported signature algorithm %r' % algorithm)
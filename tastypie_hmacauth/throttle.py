@@ -0,0 +1,112 @@
+from __future__ import division, unicode_literals
+import itertools
+import threading
+import time
+
+from django.core.cache import caches
+from tastypie.throttle import BaseThrottle
+
+
+class HMACThrottle(BaseThrottle):
+    """Limits each client to ``throttle_at`` requests per sliding ``timeframe``, in memory
+
+    Pair it with HMACAuthentication, whose get_identifier is the client's public key.
+    The window is split in ``slots`` buckets. Requests are counted per process with
+    itertools.count, whose ``next`` is atomic, so neither checking nor recording an access
+    takes a lock or touches the cache. Every ``sync_interval`` seconds one request pushes
+    the new counts to the ``cache_alias`` Django cache and reads back those of the other
+    processes. The limit across processes is therefore exceeded by at most what they
+    serve in one interval.
+    """
+
+    def __init__(self, throttle_at=150, timeframe=3600, expiration=None, slots=10, cache_alias=None,
+                 sync_interval=5, key_prefix='hmacauth:throttle:', timer=time.time):
+        super(HMACThrottle, self).__init__(throttle_at, timeframe, expiration)
+        self.slots = slots
+        self.slot_width = timeframe / slots
+        self.cache_alias = cache_alias
+        self.sync_interval = sync_interval
+        self.key_prefix = key_prefix
+        self.timer = timer
+        self._counters = {}  # (identifier, slot) -> itertools.count
+        self._seen = {}      # (identifier, slot) -> accesses served by this process
+        self._synced = {}    # (identifier, slot) -> part of _seen already pushed to the cache
+        self._shared = {}    # (identifier, slot) -> count of every process, at the last sync
+        self._sync_lock = threading.Lock()
+        self._next_sync = timer() + sync_interval
+
+    def _current_slot(self):
+        return int(self.timer() // self.slot_width)
+
+    def _window(self, identifier):
+        current = self._current_slot()
+        return [(identifier, slot) for slot in range(current - self.slots + 1, current + 1)]
+
+    def _cache_key(self, key):
+        return '%s%s:%d' % (self.key_prefix, self.convert_identifier_to_key(key[0]), key[1])
+
+    def count(self, identifier):
+        """Accesses of ``identifier`` in the current window, as far as this process knows"""
+        total = 0
+        for key in self._window(identifier):
+            total += self._shared.get(key, 0) + self._seen.get(key, 0) - self._synced.get(key, 0)
+        return total
+
+    def should_be_throttled(self, identifier, **kwargs):
+        return self.count(identifier) >= self.throttle_at
+
+    def accessed(self, identifier, **kwargs):
+        key = (identifier, self._current_slot())
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count(1))
+        self._seen[key] = next(counter)
+
+        if self.timer() >= self._next_sync:
+            self.sync()
+
+    def sync(self):
+        """Drops expired slots and exchanges counts with other processes through the cache
+
+        Runs on one thread at a time, the others keep serving requests meanwhile.
+        """
+        if not self._sync_lock.acquire(False):
+            return
+        try:
+            self._next_sync = self.timer() + self.sync_interval
+            oldest = self._current_slot() - self.slots + 1
+            for key in list(self._counters):
+                if key[1] < oldest:
+                    for counts in (self._counters, self._seen, self._synced, self._shared):
+                        counts.pop(key, None)
+
+            if self.cache_alias is not None:
+                self._exchange(caches[self.cache_alias])
+        finally:
+            self._sync_lock.release()
+
+    def _exchange(self, cache):
+        timeout = int(self.timeframe + self.slot_width) + 1
+        shared = {}
+        for key, seen in list(self._seen.items()):
+            delta = seen - self._synced.get(key, 0)
+            if not delta:
+                continue
+            cache_key = self._cache_key(key)
+            cache.add(cache_key, 0, timeout)
+            try:
+                shared[key] = cache.incr(cache_key, delta)
+            except ValueError:  # expired between add and incr
+                cache.set(cache_key, delta, timeout)
+                shared[key] = delta
+            self._synced[key] = seen
+
+        keys = []
+        for identifier in set(key[0] for key in list(self._seen)):
+            keys.extend(key for key in self._window(identifier) if key not in shared)
+        counts = cache.get_many([self._cache_key(key) for key in keys])
+        for key in keys:
+            count = counts.get(self._cache_key(key))
+            if count is not None:
+                shared[key] = count
+        self._shared.update(shared)
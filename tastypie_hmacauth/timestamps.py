@@ -0,0 +1,39 @@
+from __future__ import unicode_literals
+from datetime import date
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Epoch seconds only get this large in the year 5138, so anything above is milliseconds
+MILLISECONDS_THRESHOLD = 10 ** 11
+
+
+def parse_timestamp(timestamp):
+    """Returns the UTC epoch seconds of ``timestamp``
+
+    ``timestamp`` is either a string in %Y-%m-%dT%H:%M:%S format, in UTC, or an integer
+    number of epoch seconds or milliseconds. Raises ValueError for anything else.
+
+    Reads the fields from fixed positions, which is a lot cheaper than strptime and
+    doesn't depend on the server time zone the way time.mktime does.
+    """
+    if timestamp.isdigit():
+        value = int(timestamp)
+        return value // 1000 if value >= MILLISECONDS_THRESHOLD else value
+
+    if len(timestamp) != 19 or timestamp[4] != '-' or timestamp[7] != '-' or timestamp[10] != 'T' or \
+            timestamp[13] != ':' or timestamp[16] != ':':
+        raise ValueError('timestamp %r does not match %s' % (timestamp, TIMESTAMP_FORMAT))
+
+    fields = (timestamp[0:4], timestamp[5:7], timestamp[8:10], timestamp[11:13], timestamp[14:16], timestamp[17:19])
+    if not ''.join(fields).isdigit():
+        raise ValueError('timestamp %r does not match %s' % (timestamp, TIMESTAMP_FORMAT))
+
+    year, month, day, hour, minute, second = [int(field) for field in fields]
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError('timestamp %r is not a valid time' % timestamp)
+
+    # date() validates year, month and day
+    days = date(year, month, day).toordinal() - EPOCH_ORDINAL
+    return days * 86400 + hour * 3600 + minute * 60 + second
@@ -0,0 +1,87 @@
+"""Short-lived tokens that stand in for HMAC signatures
+
+A client signs one request to views.issue_token and gets back a token holding its
+principal's primary key, scopes and expiry, MACed with a key derived from SECRET_KEY. It
+then sends ``Authorization: HMACToken <token>`` instead of signing each request, and the
+server checks a single MAC over the token, with no canonicalization, body hashing or user
+lookup:
+
+    hmac_config = HMACAuthConfig(tokens=TokenSigner(max_age=300))
+
+Tokens are bearer credentials: they don't cover the request they come with, so only send
+them over HTTPS. Nothing is stored, so a user deactivated after a token was issued keeps
+access until the token expires; keep ``max_age`` short.
+"""
+from __future__ import unicode_literals
+import base64
+import binascii
+import hashlib
+import time
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+
+from .compat import compare_digest, force_text
+from .principals import Principal
+from .signing import keyed_hmac
+
+TOKEN_SCHEME = 'HMACToken'
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def token_from_request(request):
+    """Returns the token of an ``Authorization: HMACToken <token>`` header, None if there is none"""
+    auth_type, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if auth_type.lower() != TOKEN_SCHEME.lower():
+        return None
+    return token.strip()
+
+
+class TokenSigner(object):
+    """Issues tokens valid for ``max_age`` seconds, and verifies them
+
+    The MAC key is derived from ``secret``, settings.SECRET_KEY by default, and ``salt``, so
+    tokens can't be mistaken for anything else signed with that secret. Changing either
+    invalidates every token issued.
+    """
+
+    def __init__(self, max_age=300, secret=None, salt='tastypie_hmacauth.tokens', timer=time.time):
+        self.max_age = max_age
+        self.secret = secret
+        self.salt = salt
+        self.timer = timer
+
+    def key(self):
+        return hashlib.sha256(force_bytes(self.salt) + force_bytes(self.secret or settings.SECRET_KEY)).digest()
+
+    def mac(self, payload):
+        digest_maker = keyed_hmac(self.key())
+        digest_maker.update(payload)
+        return _encode(digest_maker.digest())
+
+    def issue(self, principal):
+        """Returns a token for ``principal`` and the epoch it expires at"""
+        expires = int(self.timer()) + self.max_age
+        payload = _encode(force_bytes('%d|%s|%s' % (expires, ','.join(principal.scopes), principal.pk)))
+        return force_text(payload + b'.' + self.mac(payload)), expires
+
+    def verify(self, token):
+        """Returns the Principal ``token`` was issued to, None if it is forged, malformed or expired"""
+        payload, _, mac = force_bytes(token).rpartition(b'.')
+        if not payload or not compare_digest(self.mac(payload), mac):
+            return None
+        try:
+            expires, scopes, pk = force_text(_decode(payload)).split('|', 2)
+            expires = int(expires)
+        except (binascii.Error, TypeError, ValueError):
+            return None
+        if expires <= self.timer():
+            return None
+        return Principal(pk, True, [scope for scope in scopes.split(',') if scope])
@@ -0,0 +1,81 @@
+from __future__ import unicode_literals
+import json
+
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
+from tastypie.http import HttpBadRequest, HttpUnauthorized
+
+from .authentication import PRINCIPAL_ATTRIBUTE
+from .tokens import TOKEN_SCHEME, token_from_request
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+BATCH_FIELDS = ('method', 'url', 'body', 'public_key', 'api_key', 'timestamp', 'algorithm', 'content_sha256')
+
+
+def metrics(request, metrics):
+    """Exposes a PrometheusMetrics to Prometheus scrapers
+
+    urlpatterns = patterns('',
+        url(r'^metrics/$', 'tastypie_hmacauth.views.metrics', {'metrics': hmac_metrics}),
+    )
+    """
+    return HttpResponse(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@csrf_exempt
+def verify_batch(request, verifier):
+    """Verifies a bundle of signed requests with a batch.BatchVerifier
+
+    The bundle is itself an HMAC signed POST, checked by the verifier's authentication:
+
+        {"requests": [{"method": "GET", "url": "https://host/api/v1/patrao/?public_key=1&...",
+                       "body": "", "public_key": "1", "api_key": "...", "timestamp": "..."}]}
+
+    and gets back {"results": [{"valid": false, "reason": "bad_signature"}]}. ``algorithm`` is
+    optional, and only read in header mode. ``content_sha256`` is optional, and only read
+    when the authentication has ``body_digest``.
+
+    urlpatterns = patterns('',
+        url(r'^verify/$', 'tastypie_hmacauth.views.verify_batch', {'verifier': BatchVerifier()}),
+    )
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not verifier.authentication.is_authenticated(request):
+        return HttpUnauthorized()
+
+    try:
+        bundle = json.loads(request.body.decode('utf-8'))
+        items = [tuple(entry.get(field) for field in BATCH_FIELDS) for entry in bundle['requests']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpBadRequest('Expected {"requests": [{%s}, ...]}' % ', '.join('"%s": ...' % f for f in BATCH_FIELDS))
+
+    results = [{'valid': result.valid, 'reason': result.reason} for result in verifier.verify(items)]
+    return HttpResponse(json.dumps({'results': results}), content_type='application/json')
+
+
+@csrf_exempt
+def issue_token(request, authentication):
+    """Exchanges an HMAC signed POST for a token of ``authentication.tokens``, a tokens.TokenSigner
+
+    Answers {"token": "...", "token_type": "HMACToken", "expires": <epoch>}. Tokens can't be
+    renewed with a token, only with a signed request.
+
+    urlpatterns = patterns('',
+        url(r'^token/$', 'tastypie_hmacauth.views.issue_token', {'authentication': authentication}),
+    )
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if token_from_request(request) is not None:
+        return HttpBadRequest('Tokens are only issued to HMAC signed requests')
+    if not authentication.is_authenticated(request):
+        return HttpUnauthorized()
+    principal = getattr(request, PRINCIPAL_ATTRIBUTE)
+    if not principal.is_active:
+        return HttpUnauthorized()
+
+    token, expires = authentication.tokens.issue(principal)
+    body = {'token': token, 'token_type': TOKEN_SCHEME, 'expires': expires}
+    return HttpResponse(json.dumps(body), content_type='application/json')
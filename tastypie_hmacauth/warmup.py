@@ -0,0 +1,115 @@
+"""Loads principals and secrets into memory before the first request needs them
+
+Resources have to share the process-wide structures this module fills:
+
+    from tastypie_hmacauth.warmup import get_keyring, get_user_cache
+
+    hmac_config = HMACAuthConfig(user_cache=get_user_cache(), keyring=get_keyring())
+
+and settings turn the warm-up on, see apps.HMACAuthAppConfig:
+
+    HMACAUTH_USER_CACHE = {'maxsize': 10000, 'ttl': 600}
+    HMACAUTH_WARMUP = {'limit': 10000, 'refresh_interval': 300, 'keyring': True}
+"""
+from __future__ import unicode_literals
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from tastypie.compat import get_user_model
+
+from .cache import UserCache
+from .principals import principal_fields, principal_from_row
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_user_cache = None
+_keyring = None
+_refresher = None
+
+
+def get_user_cache():
+    """The process-wide UserCache, built with the keyword arguments in settings.HMACAUTH_USER_CACHE"""
+    global _user_cache
+    with _lock:
+        if _user_cache is None:
+            _user_cache = UserCache(**getattr(settings, 'HMACAUTH_USER_CACHE', {}))
+        return _user_cache
+
+
+def get_keyring():
+    """The process-wide ModelKeyring"""
+    global _keyring
+    with _lock:
+        if _keyring is None:
+            from .keyring import ModelKeyring
+            _keyring = ModelKeyring()
+        return _keyring
+
+
+def warm_up(limit=None, keyring=False):
+    """Loads the principals of up to ``limit`` active users, most recently seen first, into get_user_cache()
+
+    Principals are streamed from a single query. With ``keyring``, the secrets are loaded into
+    get_keyring() first and only users holding an active secret are loaded. Returns the
+    number of users loaded.
+    """
+    user_cache = get_user_cache()
+    if limit is None:
+        limit = user_cache.local.maxsize
+
+    users = get_user_model().objects.filter(is_active=True)
+    if keyring:
+        get_keyring().load()
+        users = users.filter(hmac_secrets__is_active=True).distinct()
+
+    fields = principal_fields()
+    loaded = 0
+    for row in users.order_by('-last_login').values_list(*fields)[:limit].iterator():
+        principal = principal_from_row(fields, row)
+        user_cache.set(principal.pk, principal)
+        loaded += 1
+    return loaded
+
+
+class Refresher(threading.Thread):
+    """Runs warm_up every ``interval`` seconds, so warmed entries never expire under load
+
+    Each refresh opens its own database connection and closes it when done, as a request
+    would, so the thread never holds one past the server's idle timeout.
+    """
+
+    def __init__(self, interval, **options):
+        super(Refresher, self).__init__(name='hmacauth-warmup')
+        self.daemon = True
+        self.interval = interval
+        self.options = options
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                warm_up(**self.options)
+            except DatabaseError:
+                logger.exception('Refreshing HMAC principals failed')
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_refresher(interval, **options):
+    """Starts the background refresh, once per process
+
+    Threads don't survive a fork: with gunicorn's preload_app, call it from post_fork.
+    """
+    global _refresher
+    with _lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = Refresher(interval, **options)
+            _refresher.start()
+        return _refresher
@@ -8,7 +8,10 @@ from tastypie import fields
 from tastypie.api import Api
 from datetime import datetime
 from rh.models import Patrao, Funcionario
-from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth import HMACAuthentication, HMACAuthConfig
+from tastypie_hmacauth.tokens import TokenSigner
+
+hmac_config = HMACAuthConfig(body_digest=True, tokens=TokenSigner(max_age=300))
 
 
 class UserResource(ModelResource):
@@ -20,7 +23,7 @@ class UserResource(ModelResource):
             'username': ALL,
             'id' : ['exact'],
         }
-        authentication = HMACAuthentication()
+        authentication = HMACAuthentication(config=hmac_config)
         authorization = Authorization()
 
 
@@ -32,7 +35,7 @@ class PatraoResource(ModelResource):
         filtering = {
             'usuario': ALL_WITH_RELATIONS,
         }
-        authentication = HMACAuthentication()
+        authentication = HMACAuthentication(config=hmac_config)
         authorization = Authorization()
 
 class FuncionarioResource(ModelResource):
@@ -44,7 +47,7 @@ class FuncionarioResource(ModelResource):
         filtering = {
             'usuario': ALL_WITH_RELATIONS,
         }
-        authentication = HMACAuthentication()
+        authentication = HMACAuthentication(config=hmac_config)
         authorization = Authorization()
 
 v1_api = Api(api_name='v1')
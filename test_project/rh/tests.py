@@ -5,16 +5,58 @@ import requests
 import hmac
 import hashlib
 import json
-from datetime import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
 from django.conf import settings
 from django_nose.tools import assert_code
 from django.core import management
 from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from werkzeug.test import Client
 from werkzeug.wrappers import BaseResponse
 from test_project.wsgi import application as app
 from autofixture import AutoFixture
 from rh.models import Patrao, Funcionario
+from tastypie_hmacauth import HMACAuthentication, HMACAuthConfig, UserCache
+from tastypie_hmacauth.batch import BatchVerifier
+from tastypie_hmacauth.cache import LRUCache
+from tastypie_hmacauth.canonical import canonical_query
+from tastypie_hmacauth.client import HMACClient, Signer
+from tastypie_hmacauth.keyring import ModelKeyring
+from tastypie_hmacauth import metrics
+from tastypie_hmacauth.metrics import PrometheusMetrics
+from tastypie_hmacauth.middleware import HMACAuthenticationMiddleware
+from tastypie_hmacauth.models import ClientSecret
+from tastypie_hmacauth.nonces import LocalNonceStore
+from tastypie_hmacauth.principals import Principal
+from tastypie_hmacauth.sharedindex import SharedIndex
+from tastypie_hmacauth.signing import BLAKE2B_256, HMAC_SHA256, HMAC_SHA512, available_algorithms
+from tastypie_hmacauth.throttle import HMACThrottle
+from tastypie_hmacauth.tokens import TokenSigner
+from tastypie_hmacauth import warmup
+from django.apps import apps
+from tastypie.exceptions import ImmediateHttpResponse
+from nose.tools import assert_raises
+from unittest import SkipTest
+
+try:
+    from urllib.parse import parse_qsl
+except ImportError:  # Python 2
+    from urlparse import parse_qsl
+
+try:
+    import asyncio
+    from tastypie_hmacauth import aio
+except (ImportError, SyntaxError):  # Python 2, or Django < 3.1
+    aio = None
 
 funcionarios = '/api/v1/funcionario/'
 patroes = '/api/v1/patrao/'
@@ -38,12 +80,15 @@ def setup_module():
     fixture.create(QTD_PATROES)
 
 
-def hmac_hashing(url, payload=None, ssl_on=False):
+def hmac_hashing(url, payload=None, ssl_on=False, algorithm=None):
 
+    if algorithm:
+        url = url.replace('?', '?algorithm=' + algorithm + '&', 1)
     url_to_hash = PREFIX + url if not ssl_on else PREFIX_SSL + url
     if payload:
         url_to_hash += json.dumps(payload)
-    digest_maker = hmac.new(settings.SECRET_KEY, url_to_hash, hashlib.sha256)
+    digestmod = hashlib.sha512 if algorithm == HMAC_SHA512 else hashlib.sha256
+    digest_maker = hmac.new(settings.SECRET_KEY, url_to_hash, digestmod)
     digest = digest_maker.hexdigest()
     if 'public_key' in url:
         url = url + "&api_key=" + digest
@@ -250,17 +295,567 @@ def test_POST_criacao_usuario_SSL():
 def test_PUT_edicao_usuario_SSL():
     """Tem de retornar o codigo 204, pois informará que o usuário foi atualizado, usando SSL (HTTPS)"""
 
-    response = put(usuarios + '2/' + '?public_key=1&timestamp=' + TIMESTAMP_AGORA, {"first_name":"First Name SSL"}, ssl_on=True)
+    response = put(usuarios + '2/' + '?public_key=2&timestamp=' + TIMESTAMP_AGORA, {"first_name":"First Name SSL"}, ssl_on=True)
     assert_code(response, 204)
 
 def test_PATCH_edicao_usuario_SSL():
     """Tem de retornar o codigo 202, pois informará que a atualização do usuário foi aceita (PATCH), usando SSL (HTTPS)"""
 
-    response = patch(usuarios + '2/' + '?public_key=1&timestamp=' + TIMESTAMP_AGORA, {"first_name":"Patched Name SSL"}, ssl_on=True)
+    response = patch(usuarios + '2/' + '?public_key=2&timestamp=' + TIMESTAMP_AGORA, {"first_name":"Patched Name SSL"}, ssl_on=True)
     assert_code(response, 202)
 
 def test_DELETE_usuario_SSL():
     """Tem de retornar o codigo 204, pois informará que o usuário foi excluído, usando SSL (HTTPS)"""
 
-    response = delete(usuarios + '2/' + '?public_key=1&timestamp=' + TIMESTAMP_AGORA, ssl_on=True)
+    response = delete(usuarios + '2/' + '?public_key=2&timestamp=' + TIMESTAMP_AGORA, ssl_on=True)
     assert_code(response, 204)
+
+def test_cache_de_usuarios():
+    """Tem de buscar o usuario no banco apenas uma vez e invalidar o cache quando o usuario for alterado"""
+
+    user = User.objects.create_user(username='usuario_cache', password='pass')
+    user_cache = UserCache(ttl=60)
+    auth = HMACAuthentication(user_cache=user_cache)
+
+    assert auth.get_user(str(user.pk)).pk == str(user.pk)
+    assert auth.get_user(str(user.pk)).pk == str(user.pk)
+    assert user_cache.stats()['hits'] == 1
+
+    user.is_active = False
+    user.save()
+    assert not auth.get_user(str(user.pk)).is_active
+
+def test_cache_de_public_keys_desconhecidas():
+    """Tem de recusar public_keys desconhecidas sem consultar o banco de novo, ate o usuario ser criado"""
+
+    user_cache = UserCache(ttl=60)
+    auth = HMACAuthentication(user_cache=user_cache)
+    desconhecida = str(User.objects.order_by('-pk')[0].pk + 1000)
+
+    with CaptureQueriesContext(connection) as consultas:
+        assert auth.get_user(desconhecida) is None
+        assert auth.get_user(desconhecida) is None
+        assert auth.get_user('abc') is None
+    assert len(consultas) == 1
+    assert user_cache.stats()['unknown_hits'] == 1
+
+    user = User.objects.create_user(username='usuario_desconhecido', password='pass', id=int(desconhecida))
+    assert auth.get_user(desconhecida).pk == str(user.pk)
+
+def test_hash_do_corpo_em_partes():
+    """Tem de calcular o mesmo HMAC lendo o corpo em partes e manter o corpo disponivel para o Tastypie"""
+
+    payload = json.dumps({"nome": "Funcionário", "cargo": "x" * 100})
+    request = RequestFactory().post(funcionarios, data=payload, content_type='application/json')
+    auth = HMACAuthentication(body_chunk_size=7)
+
+    digest_maker = hmac.new(settings.SECRET_KEY, digestmod=hashlib.sha256)
+    auth.hash_body(request, digest_maker)
+
+    assert digest_maker.hexdigest() == hmac.new(settings.SECRET_KEY, payload, hashlib.sha256).hexdigest()
+    assert request.body == payload
+
+def test_keyring_com_segredos_por_cliente():
+    """Tem de aceitar qualquer segredo ativo do cliente e recusar os revogados"""
+
+    user = User.objects.create_user(username='usuario_keyring', password='pass')
+    antigo = ClientSecret.objects.create(user=user)
+    novo = ClientSecret.objects.create(user=user)
+    auth = HMACAuthentication(keyring=ModelKeyring())
+
+    url = funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)
+    for secret in (antigo.secret, novo.secret):
+        api_key = hmac.new(str(secret), PREFIX + url, hashlib.sha256).hexdigest()
+        assert auth.is_api_key_valid(api_key, RequestFactory().get(url + '&api_key=' + api_key))
+
+    antigo.is_active = False
+    antigo.save()
+    api_key = hmac.new(str(antigo.secret), PREFIX + url, hashlib.sha256).hexdigest()
+    assert_raises(ImmediateHttpResponse, auth.is_api_key_valid, api_key, RequestFactory().get(url + '&api_key=' + api_key))
+
+    url = funcionarios + '?public_key=20&timestamp=' + TIMESTAMP_AGORA
+    api_key = hmac.new(str(novo.secret), PREFIX + url, hashlib.sha256).hexdigest()
+    assert_raises(ImmediateHttpResponse, auth.is_api_key_valid, api_key, RequestFactory().get(url + '&api_key=' + api_key))
+
+def test_replay_recusado():
+    """Tem de aceitar a requisicao apenas uma vez quando houver um nonce store"""
+
+    user = User.objects.create_user(username='usuario_replay', password='pass')
+    nonce_store = LocalNonceStore(timestamp_window=5)
+    auth = HMACAuthentication(nonce_store=nonce_store)
+
+    url = hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA))
+    assert auth.is_authenticated(RequestFactory().get(url))
+    assert not auth.is_authenticated(RequestFactory().get(url))
+    assert nonce_store.stats()['occupancy'] == 1
+    assert nonce_store.stats()['replayed'] == 1
+
+    assert_raises(ValueError, HMACAuthConfig, timestamp_window=15, nonce_store=LocalNonceStore(timestamp_window=5))
+    auth = HMACAuthentication(timestamp_window=15, nonce_store=LocalNonceStore(timestamp_window=15))
+    antigo = (datetime.utcnow() - timedelta(minutes=10)).strftime("%Y-%m-%dT%H:%M:%S")
+    assert auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, antigo))))
+
+def test_timestamp_em_epoch():
+    """Tem de aceitar timestamps em segundos e milissegundos desde a epoch e recusar os muito no futuro"""
+
+    user = User.objects.create_user(username='usuario_epoch', password='pass')
+    agora = int(time.time())
+
+    assert_code(get(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, agora)), 200)
+    assert_code(get(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, agora * 1000)), 200)
+    assert_code(get(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, agora + 3600)), 401)
+
+def test_query_canonica():
+    """Tem de ordenar os parametros, manter chaves repetidas e decodificar os valores"""
+
+    canonica = u'?a=1&a=3&b=2&c=João Silva'.encode('utf-8')
+    assert canonical_query(b'b=2&a=1&api_key=x&a=3&c=Jo%C3%A3o+Silva') == canonica
+    assert canonical_query(u'c=João Silva&a=1&b=2&a=3') == canonica
+    assert canonical_query(b'api_key=x') == b''
+
+def test_credenciais_no_cabecalho():
+    """Tem de autenticar pelo cabecalho Authorization, assinando public_key e timestamp como se estivessem na url"""
+
+    user = User.objects.create_user(username='usuario_cabecalho', password='pass')
+    auth = HMACAuthentication(mode='header')
+
+    assinada = PREFIX + funcionarios + '?limit=1&public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)
+    api_key = hmac.new(settings.SECRET_KEY, assinada, hashlib.sha256).hexdigest()
+    cabecalho = 'HMAC %s:%s:%s' % (user.pk, api_key, TIMESTAMP_AGORA)
+
+    assert auth.is_authenticated(RequestFactory().get(funcionarios + '?limit=1', HTTP_AUTHORIZATION=cabecalho))
+    assert not auth.is_authenticated(RequestFactory().get(funcionarios + '?limit=2', HTTP_AUTHORIZATION=cabecalho))
+    assert not auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA))))
+
+def test_cache_de_verificacao():
+    """Tem de reaproveitar a verificacao de um GET ja autenticado, nunca a de outra url nem a de um usuario desativado"""
+
+    user = User.objects.create_user(username='usuario_verificacao', password='pass')
+    verification_cache = LRUCache(maxsize=10)
+    auth = HMACAuthentication(verification_cache=verification_cache)
+
+    url = hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA))
+    assert auth.is_authenticated(RequestFactory().get(url))
+    request = RequestFactory().get(url)
+    assert auth.is_authenticated(request)
+    assert verification_cache.stats()['hits'] == 1
+    assert auth.get_identifier(request) == str(user.pk)
+    assert request.user.username == 'usuario_verificacao'
+    assert not auth.is_authenticated(RequestFactory().get(url + '&limit=1'))
+
+    cabecalho = Signer(user.pk, settings.SECRET_KEY, mode='header').sign('GET', PREFIX + funcionarios)[1]['Authorization']
+    auth_cabecalho = HMACAuthentication(mode='header', verification_cache=LRUCache(maxsize=10))
+    assert auth_cabecalho.is_authenticated(RequestFactory().get(funcionarios, HTTP_AUTHORIZATION=cabecalho))
+    outro_algoritmo = cabecalho + ' algorithm=' + HMAC_SHA512
+    assert not auth_cabecalho.is_authenticated(RequestFactory().get(funcionarios, HTTP_AUTHORIZATION=outro_algoritmo))
+
+    user.is_active = False
+    user.save()
+    assert not auth.is_authenticated(RequestFactory().get(url))
+
+def test_metricas_por_motivo_de_falha():
+    """Tem de contar as falhas por motivo e medir o tempo de cada etapa"""
+
+    user = User.objects.create_user(username='usuario_metricas', password='pass')
+    hmac_metrics = PrometheusMetrics()
+    auth = HMACAuthentication(instrumentation=hmac_metrics)
+
+    assert auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA))))
+    assert not auth.is_authenticated(RequestFactory().get(funcionarios + '?public_key=%s' % user.pk))
+    assert not auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_ANTIGO))))
+    assert not auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + '?public_key=999&timestamp=' + TIMESTAMP_AGORA)))
+
+    texto = hmac_metrics.render()
+    assert 'hmacauth_success_total 1' in texto
+    assert 'hmacauth_failure_total{reason="missing_credential"} 1' in texto
+    assert 'hmacauth_failure_total{reason="stale_timestamp"} 1' in texto
+    assert 'hmacauth_failure_total{reason="unknown_user"} 1' in texto
+    assert 'hmacauth_stage_seconds_count{stage="timestamp"} 3' in texto
+    assert 'hmacauth_stage_seconds_count{stage="signature"} 2' in texto
+
+    # excecoes inesperadas nao sao culpa do cliente
+    class BancoFora(HMACAuthentication):
+        def get_user(self, public_key):
+            raise OperationalError('database is down')
+
+    class CacheQuebrado(object):
+        def get(self, key):
+            return None
+
+        def set(self, key, value, expires_at=None):
+            raise RuntimeError('cache is down')
+
+    hmac_metrics = PrometheusMetrics()
+    url = hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA))
+    assert not BancoFora(instrumentation=hmac_metrics).is_authenticated(RequestFactory().get(url))
+    assert not HMACAuthentication(instrumentation=hmac_metrics, verification_cache=CacheQuebrado()).is_authenticated(RequestFactory().get(url))
+    texto = hmac_metrics.render()
+    assert 'hmacauth_failure_total{reason="error"} 2' in texto
+    assert 'unknown_user' not in texto and 'missing_credential' not in texto
+
+def test_autenticacao_uma_vez_por_requisicao():
+    """Tem de verificar a assinatura apenas uma vez, mesmo passando pelo middleware e por varios recursos"""
+
+    user = User.objects.create_user(username='usuario_uma_vez', password='pass')
+    hmac_metrics = PrometheusMetrics()
+    request = RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)))
+
+    with override_settings(HMACAUTH_MIDDLEWARE_OPTIONS={'instrumentation': hmac_metrics}):
+        middleware = HMACAuthenticationMiddleware()
+    middleware.process_request(request)
+    assert HMACAuthentication(instrumentation=hmac_metrics).is_authenticated(request)
+    assert HMACAuthentication(instrumentation=hmac_metrics).is_authenticated(request)
+
+    texto = hmac_metrics.render()
+    assert 'hmacauth_success_total 3' in texto
+    assert 'hmacauth_stage_seconds_count{stage="signature"} 1' in texto
+
+    user.is_active = False
+    user.save()
+    assert not HMACAuthentication().is_authenticated(RequestFactory().get(request.get_full_path()))
+
+def test_configuracao_compartilhada():
+    """Nao pode deixar o SECRET_ID desligar require_active para as requisicoes seguintes"""
+
+    user = User.objects.create_user(username='usuario_config', password='pass')
+    user.is_active = False
+    user.save()
+    config = HMACAuthConfig()
+    auth = HMACAuthentication(config=config)
+    url = '?public_key=%s&timestamp=' + TIMESTAMP_AGORA
+
+    assert auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + url % settings.SECRET_ID)))
+    assert not auth.is_authenticated(RequestFactory().get(hmac_hashing(funcionarios + url % user.pk)))
+    assert HMACAuthentication(config=config, require_active=False).is_authenticated(
+        RequestFactory().get(hmac_hashing(funcionarios + url % user.pk)))
+    assert config.require_active
+    assert_raises(AttributeError, setattr, config, 'require_active', False)
+    assert_raises(AttributeError, setattr, auth, 'require_active', False)
+
+def test_verificacao_em_lote():
+    """Tem de verificar varias requisicoes assinadas com uma unica consulta de usuarios"""
+
+    user = User.objects.create_user(username='usuario_lote', password='pass')
+    inativo = User.objects.create_user(username='usuario_lote_inativo', password='pass')
+    inativo.is_active = False
+    inativo.save()
+
+    def item(method, url, public_key, timestamp=TIMESTAMP_AGORA, payload=None):
+        url = hmac_hashing(url + '?public_key=%s&timestamp=%s' % (public_key, timestamp), payload)
+        body = json.dumps(payload) if payload else ''
+        return (method, PREFIX + url, body, str(public_key), url.rsplit('api_key=', 1)[1], timestamp)
+
+    itens = [
+        item('GET', funcionarios, user.pk),
+        item('POST', patroes, user.pk, payload={'usuario': '/api/v1/usuario/%s/' % user.pk}),
+        item('GET', funcionarios, user.pk)[:4] + ('0' * 64, TIMESTAMP_AGORA),
+        item('GET', funcionarios, 999999),
+        item('GET', funcionarios, inativo.pk),
+        item('GET', funcionarios, user.pk, timestamp=TIMESTAMP_ANTIGO),
+    ]
+    with CaptureQueriesContext(connection) as consultas:
+        resultados = BatchVerifier().verify(itens)
+    assert len(consultas) == 1
+    assert [resultado.reason for resultado in resultados] == [
+        None, None, 'bad_signature', 'unknown_user', 'inactive_user', 'stale_timestamp']
+
+    # no modo query, public_key e timestamp sao os assinados na URL, nao os do item
+    antigo = item('GET', funcionarios, user.pk, timestamp=TIMESTAMP_ANTIGO)
+    segredo = ClientSecret.objects.create(user=user)
+    alvo = '%s?public_key=%s&timestamp=%s' % (funcionarios, inativo.pk, TIMESTAMP_AGORA)
+    api_key = hmac.new(str(segredo.secret), PREFIX + alvo, hashlib.sha256).hexdigest()
+    resultados = [BatchVerifier().verify([antigo[:5] + (TIMESTAMP_AGORA,)])[0],
+                  BatchVerifier(HMACAuthentication(keyring=ModelKeyring())).verify(
+                      [('GET', PREFIX + alvo, '', str(user.pk), api_key, TIMESTAMP_AGORA)])[0]]
+    assert [resultado.reason for resultado in resultados] == ['bad_signature', 'bad_signature']
+
+    response = post('/verify/?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA),
+                    {'requests': [dict(zip(('method', 'url', 'body', 'public_key', 'api_key', 'timestamp'), i)) for i in itens[:3]]})
+    assert_code(response, 200)
+    assert [r['valid'] for r in json.loads(response.data)['results']] == [True, True, False]
+
+    campos = ('method', 'url', 'body', 'public_key', 'api_key', 'timestamp')
+    numerico = dict(zip(campos, itens[0]), timestamp=int(time.time()))
+    sem_url = dict(zip(campos, itens[0]))
+    del sem_url['url']
+    response = post('/verify/?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA), {'requests': [numerico, sem_url]})
+    assert_code(response, 200)
+    assert [r['reason'] for r in json.loads(response.data)['results']] == ['stale_timestamp', 'missing_credential']
+
+    hmac_metrics = PrometheusMetrics()
+    verificador = BatchVerifier(HMACAuthentication(body_digest=True, instrumentation=hmac_metrics))
+    corpo = json.dumps({'usuario': '/api/v1/usuario/%s/' % user.pk})
+    url, headers = Signer(user.pk, settings.SECRET_KEY, body_digest=True).sign('POST', PREFIX + patroes, corpo)
+    query = dict(parse_qsl(url.split('?', 1)[1]))
+    assinado = ('POST', url, corpo, query['public_key'], query['api_key'], query['timestamp'], None)
+    resultados = verificador.verify([assinado + ('0' * 64,), assinado + (headers['Content-SHA256'],)])
+    assert [resultado.reason for resultado in resultados] == ['bad_signature', None]
+    assert hmac_metrics.successes == 1 and hmac_metrics.failures['bad_signature'] == 1
+    assert_code(post('/verify/?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA), {'requests': []}, hashing=False), 401)
+
+def test_cliente_assinando_requisicoes():
+    """Tem de assinar as requisicoes exatamente como o servidor as verifica, inclusive corpos em arquivo"""
+
+    user = User.objects.create_user(username='usuario_cliente', password='pass')
+
+    url, headers = Signer(user.pk, settings.SECRET_KEY).sign('GET', PREFIX + funcionarios + '?q=Jo%C3%A3o&limit=1')
+    assert headers == {}
+    assert_code(Client(app, BaseResponse).get(url[len(PREFIX):]), 200)
+
+    cliente = HMACClient(PREFIX, user.pk, settings.SECRET_KEY, mode='header')
+    corpo = BytesIO(json.dumps({'usuario': '/api/v1/usuario/%s/' % user.pk}).encode('utf-8'))
+    url, headers, data = cliente.prepare('POST', patroes, params={'format': 'json'}, data=corpo)
+    assert data.tell() == 0
+    request = RequestFactory().post(url, data=data.read(), content_type='application/json',
+                                    HTTP_AUTHORIZATION=headers['Authorization'])
+    assert HMACAuthentication(mode='header').is_authenticated(request)
+
+def test_cliente_sem_settings():
+    """Tem de importar o cliente num processo sem DJANGO_SETTINGS_MODULE"""
+
+    env = dict(os.environ)
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    codigo = ("from tastypie_hmacauth.client import Signer; "
+              "print(Signer('1', 'segredo').sign('GET', 'http://localhost/api/v1/funcionario/')[0])")
+    saida = subprocess.check_output([sys.executable, '-c', codigo], env=env)
+    assert b'api_key=' in saida
+
+def test_digest_do_corpo():
+    """Tem de assinar o Content-SHA256 no lugar do corpo e recusar corpos que nao batem com ele"""
+
+    user = User.objects.create_user(username='usuario_digest', password='pass')
+    outro = User.objects.create_user(username='usuario_digest_outro', password='pass')
+    corpo = json.dumps({'usuario': '/api/v1/usuario/%s/' % user.pk})
+    adulterado = json.dumps({'usuario': '/api/v1/usuario/%s/' % outro.pk})
+    url, headers = Signer(user.pk, settings.SECRET_KEY, body_digest=True).sign('POST', PREFIX + patroes, corpo)
+    headers['Content-Type'] = 'application/json'
+    assert 'Content-SHA256' in headers
+
+    c = Client(app, BaseResponse)
+    assert_code(c.post(url[len(PREFIX):], data=corpo, headers=headers), 201)
+    assert_code(c.post(url[len(PREFIX):], data=adulterado, headers=headers), 400)
+    assert not Patrao.objects.filter(usuario=outro).exists()
+
+    request = RequestFactory().post(url, data=adulterado, content_type='application/json',
+                                    HTTP_CONTENT_SHA256=headers['Content-SHA256'])
+    assert not HMACAuthentication(body_digest=True, defer_body_digest=False).is_authenticated(request)
+    assert request.body == adulterado
+
+    for body_digest in (True, False):
+        trocado = RequestFactory().post(url, data=headers['Content-SHA256'], content_type='application/json')
+        assert not HMACAuthentication(body_digest=body_digest).is_authenticated(trocado)
+
+def test_ordem_das_etapas():
+    """Tem de recusar pelo timestamp antes de calcular o HMAC e aceitar apenas ordens com o replay por ultimo"""
+
+    user = User.objects.create_user(username='usuario_etapas', password='pass')
+    hmac_metrics = PrometheusMetrics()
+    request = RequestFactory().post(funcionarios + '?public_key=%s&timestamp=%s&api_key=x' % (user.pk, TIMESTAMP_ANTIGO),
+                                    data='{}', content_type='application/json')
+    assert not HMACAuthentication(instrumentation=hmac_metrics).is_authenticated(request)
+    assert 'stage="signature"' not in hmac_metrics.render()
+    assert not getattr(request, '_read_started', False)
+
+    url = funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)
+    legado = HMACAuthConfig(stages=(metrics.SIGNATURE, metrics.USER_LOOKUP, metrics.TIMESTAMP, metrics.REPLAY))
+    assert HMACAuthentication(config=legado).is_authenticated(RequestFactory().get(hmac_hashing(url)))
+    assert not HMACAuthentication().is_authenticated(RequestFactory().get(url + '&api_key=%C3%A3' + '0' * 62))
+    assert_raises(ValueError, HMACAuthConfig, stages=(metrics.REPLAY, metrics.SIGNATURE, metrics.USER_LOOKUP, metrics.TIMESTAMP))
+    assert_raises(ValueError, HMACAuthConfig, stages=(metrics.TIMESTAMP, metrics.REPLAY))
+
+def test_throttle_por_public_key():
+    """Tem de limitar cada public_key na sua janela e somar os acessos dos outros processos pelo cache"""
+
+    user = User.objects.create_user(username='usuario_throttle', password='pass')
+    request = RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)))
+    auth = HMACAuthentication()
+    assert auth.is_authenticated(request)
+    identificador = auth.get_identifier(request)
+    assert identificador == str(user.pk)
+
+    agora = [1000.0]
+    opcoes = dict(throttle_at=3, timeframe=60, cache_alias='default', sync_interval=1, timer=lambda: agora[0])
+    processo_a, processo_b = HMACThrottle(**opcoes), HMACThrottle(**opcoes)
+
+    for _ in range(2):
+        processo_a.accessed(identificador)
+    assert not processo_a.should_be_throttled(identificador)
+    processo_a.accessed(identificador)
+    assert processo_a.should_be_throttled(identificador)
+    assert not processo_a.should_be_throttled('outra_public_key')
+
+    agora[0] += 2
+    processo_a.sync()
+    processo_b.accessed(identificador)
+    assert processo_b.should_be_throttled(identificador)
+
+    agora[0] += 61
+    assert not processo_a.should_be_throttled(identificador)
+
+def test_aquecimento_de_principais():
+    """Tem de carregar os usuarios ativos numa unica consulta e atende-los depois sem consultar o banco"""
+
+    user = User.objects.create_user(username='usuario_aquecido', password='pass')
+    inativo = User.objects.create_user(username='usuario_aquecido_inativo', password='pass')
+    inativo.is_active = False
+    inativo.save()
+    user_cache = warmup.get_user_cache()
+    user_cache.clear()
+
+    ativos = User.objects.filter(is_active=True).count()
+    with CaptureQueriesContext(connection) as consultas:
+        assert warmup.warm_up(limit=1000) == ativos
+    assert len(consultas) == 1
+
+    auth = HMACAuthentication(user_cache=user_cache)
+    with CaptureQueriesContext(connection) as consultas:
+        assert auth.get_user(str(user.pk)).pk == str(user.pk)
+    assert len(consultas) == 0
+    assert user_cache.get(inativo.pk) is None
+
+    ClientSecret.objects.create(user=user)
+    user_cache.clear()
+    assert warmup.warm_up(keyring=True) == User.objects.filter(is_active=True, hmac_secrets__is_active=True).distinct().count()
+    assert user_cache.get(user.pk).pk == str(user.pk)
+    assert warmup.get_keyring().is_loaded()
+
+    user_cache.clear()
+    with override_settings(HMACAUTH_WARMUP={'limit': 1}):
+        apps.get_app_config('tastypie_hmacauth').ready()
+    assert user_cache.stats()['size'] == 1
+
+def test_indice_compartilhado():
+    """Tem de autenticar pelo indice mapeado em memoria, sem consultar o banco, e enxergar o indice reconstruido"""
+
+    user = User.objects.create_user(username='usuario_indice', password='pass')
+    inativo = User.objects.create_user(username='usuario_indice_inativo', password='pass')
+    inativo.is_active = False
+    inativo.save()
+    segredo = ClientSecret.objects.create(user=user)
+    diretorio = tempfile.mkdtemp()
+    try:
+        caminho = os.path.join(diretorio, 'hmac.idx')
+        management.call_command('build_hmac_index', caminho, stdout=open(os.devnull, 'w'))
+        index = SharedIndex(caminho, check_interval=0)
+        auth = HMACAuthentication(user_cache=index, keyring=index)
+
+        assert segredo.secret in index.get_secrets(str(user.pk))
+        url = funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)
+        digest = hmac.new(segredo.secret.encode('utf-8'), PREFIX + url, hashlib.sha256).hexdigest()
+        with CaptureQueriesContext(connection) as consultas:
+            assert auth.is_authenticated(RequestFactory().get(url + '&api_key=' + digest))
+            assert not HMACAuthentication(user_cache=index).get_user(str(inativo.pk)).is_active
+            assert index.is_unknown('999999')
+        assert len(consultas) == 0
+
+        novo = User.objects.create_user(username='usuario_indice_novo', password='pass')
+        assert index.get(novo.pk) is None
+        management.call_command('build_hmac_index', caminho, stdout=open(os.devnull, 'w'))
+        assert index.get(novo.pk).is_active
+    finally:
+        shutil.rmtree(diretorio)
+
+def test_principal_enxuto():
+    """Tem de buscar so pk, is_active e escopos do usuario e carregar o User apenas quando request.user for usado"""
+
+    user = User.objects.create_user(username='usuario_principal', password='pass')
+    user.is_staff = True
+    user.save()
+    auth = HMACAuthentication()
+
+    with CaptureQueriesContext(connection) as consultas:
+        principal = auth.get_user(str(user.pk))
+    assert 'password' not in consultas[-1]['sql']
+    assert principal == Principal(user.pk, True, ['staff'])
+    assert principal.has_scope('staff') and not principal.has_scope('superuser')
+    assert_raises(AttributeError, setattr, principal, 'is_active', False)
+
+    request = RequestFactory().get(hmac_hashing(funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)))
+    assert auth.is_authenticated(request)
+    with CaptureQueriesContext(connection) as consultas:
+        assert auth.get_identifier(request) == str(user.pk)
+    assert len(consultas) == 0
+    assert request.user.username == 'usuario_principal'
+
+def test_algoritmos_de_assinatura():
+    """Tem de aceitar o algoritmo escolhido pelo cliente entre os configurados e recusar os demais"""
+
+    user = User.objects.create_user(username='usuario_algoritmos', password='pass')
+    url = funcionarios + '?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA)
+    auth = HMACAuthentication()
+    assert auth.is_authenticated(RequestFactory().get(hmac_hashing(url, algorithm=HMAC_SHA512)))
+    assert not auth.is_authenticated(RequestFactory().get(hmac_hashing(url).replace('?', '?algorithm=%s&' % HMAC_SHA512)))
+    assert not HMACAuthentication(algorithms=[HMAC_SHA256]).is_authenticated(RequestFactory().get(hmac_hashing(url, algorithm=HMAC_SHA512)))
+
+    for algorithm in available_algorithms():
+        signer = Signer(user.pk, settings.SECRET_KEY, mode='header', algorithm=algorithm)
+        assinada, headers = signer.sign('GET', PREFIX + funcionarios + '?limit=1')
+        request = RequestFactory().get(assinada[len(PREFIX):], HTTP_AUTHORIZATION=headers['Authorization'])
+        assert HMACAuthentication(mode='header').is_authenticated(request)
+
+        assinada = Signer(user.pk, settings.SECRET_KEY, algorithm=algorithm).sign('GET', PREFIX + funcionarios)[0]
+        credenciais = dict(parse_qsl(assinada.split('?', 1)[1]))
+        item = ('GET', assinada, '', str(user.pk), credenciais['api_key'], credenciais['timestamp'])
+        assert BatchVerifier().verify([item])[0].valid
+
+    if BLAKE2B_256 not in available_algorithms():
+        assert_raises(ValueError, HMACAuthConfig, algorithms=[BLAKE2B_256])
+    assert_raises(ValueError, Signer, '1', settings.SECRET_KEY, algorithm='md5')
+
+def test_troca_por_token():
+    """Tem de trocar uma requisicao assinada por um token e aceitar o token sem consultar o banco ate ele expirar"""
+
+    user = User.objects.create_user(username='usuario_token', password='pass')
+    response = post('/token/?public_key=%s&timestamp=%s' % (user.pk, TIMESTAMP_AGORA), {'cliente': 'teste'})
+    assert_code(response, 200)
+    token = json.loads(response.data)['token']
+    cabecalho = 'HMACToken ' + token
+
+    assert_code(Client(app, BaseResponse).get(funcionarios, headers={'Authorization': cabecalho}), 200)
+    assert_code(Client(app, BaseResponse).post('/token/', headers={'Authorization': cabecalho}), 400)
+    assert_code(Client(app, BaseResponse).get(funcionarios, headers={'Authorization': cabecalho[:-2]}), 401)
+
+    auth = HMACAuthentication(tokens=TokenSigner())
+    request = RequestFactory().get(funcionarios, HTTP_AUTHORIZATION=cabecalho)
+    with CaptureQueriesContext(connection) as consultas:
+        assert auth.is_authenticated(request)
+        assert auth.get_identifier(request) == str(user.pk)
+    assert len(consultas) == 0
+
+    assert not HMACAuthentication().is_authenticated(RequestFactory().get(funcionarios, HTTP_AUTHORIZATION=cabecalho))
+    expirado = TokenSigner(timer=lambda: time.time() + 301)
+    assert expirado.verify(token) is None
+    assert TokenSigner(secret='outro').verify(token) is None
+
+def test_autenticacao_assincrona():
+    """Tem de autenticar pelo event loop como o HMACAuthentication, onde houver Python 3 e Django 3.1 ou mais novo"""
+
+    if aio is None:
+        raise SkipTest('tastypie_hmacauth.aio needs Python 3 and Django 3.1 or higher')
+
+    user = User.objects.create_user(username='usuario_assincrono', password='pass')
+    signer = Signer(user.pk, settings.SECRET_KEY)
+    loop = asyncio.new_event_loop()
+    auth = aio.AsyncHMACAuthentication()
+
+    def assinada(timestamp=None):
+        return RequestFactory().get(signer.sign('GET', PREFIX + funcionarios, timestamp=timestamp)[0][len(PREFIX):])
+
+    try:
+        request = assinada()
+        assert loop.run_until_complete(auth.ais_authenticated(request))
+        assert auth.get_identifier(request) == str(user.pk)
+        assert not loop.run_until_complete(auth.ais_authenticated(assinada(TIMESTAMP_ANTIGO)))
+        falsificada = RequestFactory().get(funcionarios + '?public_key=%s&timestamp=%s&api_key=%s' % (user.pk, TIMESTAMP_AGORA, '0' * 64))
+        assert not loop.run_until_complete(auth.ais_authenticated(falsificada))
+
+        def get_response(request):
+            response = loop.create_future()
+            response.set_result(request)
+            return response
+        request = loop.run_until_complete(aio.HMACAuthenticationMiddleware(get_response)(assinada()))
+        assert HMACAuthentication().get_identifier(request) == str(user.pk)
+        assert loop.run_until_complete(auth.ais_authenticated(request))
+    finally:
+        loop.close()
@@ -42,6 +42,7 @@ INSTALLED_APPS = (
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rh',
+    'tastypie_hmacauth',
     'django_nose',
     'autofixture'
 )
@@ -1,6 +1,8 @@
 from django.conf.urls import patterns, include, url
 from django.contrib import admin
-from rh.api import v1_api
+from rh.api import v1_api, hmac_config
+from tastypie_hmacauth import HMACAuthentication
+from tastypie_hmacauth.batch import BatchVerifier
 
 admin.autodiscover()
 
@@ -10,5 +12,9 @@ urlpatterns = patterns('',
     # url(r'^blog/', include('blog.urls')),
 
     url(r'^admin/', include(admin.site.urls)),
-    url(r'^api/', include(v1_api.urls))
+    url(r'^api/', include(v1_api.urls)),
+    url(r'^verify/$', 'tastypie_hmacauth.views.verify_batch',
+        {'verifier': BatchVerifier(HMACAuthentication(config=hmac_config))}),
+    url(r'^token/$', 'tastypie_hmacauth.views.issue_token',
+        {'authentication': HMACAuthentication(config=hmac_config)}),
 )